@@ -1,32 +1,30 @@
 import asyncio
-from pyrogram import Client
-from config import API_ID, API_HASH, BOT_TOKEN
-import sequence  # This will register sequence handlers
+# The client and its sequence handlers live in sequence.py; share that instance
+from sequence import app
 from handler_merging import setup_merging_handlers
 from start import setup_start_handlers
+from database import ensure_indexes
+from logs import setup_logging
 
-# Create the main bot client
-app = Client(
-    "sequence_bot",
-    api_id=API_ID,
-    api_hash=API_HASH,
-    bot_token=BOT_TOKEN,
-    workdir="/content"
-)
-
-def main():
-    """Initialize and run the bot with all features"""
+def setup_bot():
+    """Configure logging, indexes and every handler on the shared client"""
+    
+    setup_logging()
+    ensure_indexes()
     
     # Setup all handlers in correct order
     setup_start_handlers(app)
     setup_merging_handlers(app)  # Merging handlers
-    # sequence handlers are already registered via import
+    # sequence handlers are registered on app when sequence.py is imported
     
     print("🤖 Bot starting with all features...")
     print("✅ Sequence mode loaded")
     print("✅ Merging mode loaded (via handler_merging)")
     print("✅ Start handlers loaded")
-    
+
+def main():
+    """Initialize and run the bot with all features"""
+    setup_bot()
     app.run()
 
 if __name__ == "__main__":
@@ -38,6 +38,8 @@ OWNER_ID = 5380609667
 MAX_FILE_SIZE_MB = 2000  # 2GB
 MAX_AUDIO_SIZE_MB = 30   # 30MB audio limit
 MAX_CONCURRENT_PROCESSES = 3
+# Parallel file downloads/uploads per client; ranged merge downloads need several at once
+MAX_CONCURRENT_TRANSMISSIONS = 8
 
 # FFmpeg paths (update according to your system)
 FFMPEG_PATH = "ffmpeg"
@@ -1,4 +1,8 @@
-from pymongo import MongoClient
+import asyncio
+import logging
+import time
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import PyMongoError
 from config import MONGO_URI
 
 # Database connection
@@ -6,38 +10,165 @@ mongo_client = MongoClient(MONGO_URI)
 db = mongo_client["N4_Bots"]
 users_collection = db["users_sequence"]
 
+logger = logging.getLogger(__name__)
+
+class TTLDict(dict):
+    """dict whose entries expire after `ttl` seconds without being read or written.
+
+    At most `maxsize` entries are kept; inserting beyond that evicts the least recently used.
+    """
+
+    def __init__(self, ttl=1800, maxsize=10000):
+        super().__init__()
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._touched = {}  # key -> last access, kept in least-recently-used-first order
+
+    def _prune(self, now):
+        """Drop expired entries from the LRU end, then trim to maxsize"""
+        cutoff = now - self.ttl
+        touched = self._touched
+        while touched:
+            key = next(iter(touched))
+            if touched[key] >= cutoff and len(touched) <= self.maxsize:
+                break
+            del touched[key]
+            dict.pop(self, key, None)
+
+    def _alive(self, key):
+        """Refresh key's timestamp, dropping it first if it has already expired"""
+        now = time.monotonic()
+        touched = self._touched.pop(key, None)
+        if touched is None:
+            return False
+        if now - touched > self.ttl:
+            dict.pop(self, key, None)
+            return False
+        self._touched[key] = now  # re-insert at the most recently used end
+        return True
+
+    def __setitem__(self, key, value):
+        now = time.monotonic()
+        dict.__setitem__(self, key, value)
+        self._touched.pop(key, None)
+        self._touched[key] = now
+        self._prune(now)
+
+    def __getitem__(self, key):
+        if not self._alive(key):
+            raise KeyError(key)
+        return dict.__getitem__(self, key)
+
+    def __contains__(self, key):
+        return self._alive(key)
+
+    def get(self, key, default=None):
+        return dict.__getitem__(self, key) if self._alive(key) else default
+
+    def setdefault(self, key, default=None):
+        if self._alive(key):
+            return dict.__getitem__(self, key)
+        self[key] = default
+        return default
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._touched.pop(key, None)
+
+    def pop(self, key, *default):
+        self._touched.pop(key, None)
+        return dict.pop(self, key, *default)
+
 # Data storage (global variables)
-user_sequences = {}
-user_notification_msg = {}
+# Session state expires after 30 idle minutes so abandoned sessions don't pile up
+user_sequences = TTLDict()
+user_notification_msg = TTLDict()
 update_tasks = {}
+update_deadlines = {}  # Loop time at which each user's debounced notification fires
 user_settings = {} 
-processing_users = set()  # 🔥 ADDED: To prevent multiple "Processing" messages
-user_ls_state = {}  # NEW: Store LS command state
+user_locks = TTLDict()  # Per-user asyncio.Lock: only one "Processing" message per session
+user_ls_state = TTLDict()  # NEW: Store LS command state
 user_mode = {}  # NEW: Store user mode (file or caption)
 
 def get_user_stats(user_id):
     """Get user statistics from database"""
     return users_collection.find_one({"user_id": user_id})
 
+STATS_FLUSH_INTERVAL = 2.0
+_pending_stats = {}  # user_id -> [files_count, username], coalesced between flushes
+_stats_flusher = None
+
 def update_user_stats(user_id, files_count, username):
-    """Update user statistics in database"""
-    users_collection.update_one(
-        {"user_id": user_id}, 
-        {"$inc": {"files_sequenced": files_count}, "$set": {"username": username}}, 
-        upsert=True
-    )
+    """Queue a stats increment; written to the database in the next batch"""
+    global _stats_flusher
+    pending = _pending_stats.get(user_id)
+    if pending is None:
+        _pending_stats[user_id] = [files_count, username]
+    else:
+        pending[0] += files_count
+        pending[1] = username
+    if _stats_flusher is None or _stats_flusher.done():
+        _stats_flusher = asyncio.get_running_loop().create_task(_flush_stats_loop())
+
+def _write_stats(batch):
+    """Apply a batch of (user_id, (files_count, username)) in one bulk_write"""
+    users_collection.bulk_write([
+        UpdateOne(
+            {"user_id": user_id},
+            {"$inc": {"files_sequenced": count}, "$set": {"username": username}},
+            upsert=True
+        )
+        for user_id, (count, username) in batch
+    ], ordered=False)
+
+async def _flush_stats_loop():
+    while _pending_stats:
+        await asyncio.sleep(STATS_FLUSH_INTERVAL)
+        # Snapshot on the event loop so increments queued during the write aren't lost
+        batch = list(_pending_stats.items())
+        _pending_stats.clear()
+        try:
+            await asyncio.to_thread(_write_stats, batch)
+        except Exception as e:
+            logger.exception("Failed to flush stats for %d users: %s", len(batch), e)
+
+def ensure_indexes():
+    """Create the indexes the queries below rely on (no-op if they already exist).
+
+    Failures are only logged: the bot still runs without them, just with slower leaderboards.
+    """
+    try:
+        users_collection.create_index([("files_sequenced", -1)])
+    except PyMongoError as e:
+        logger.warning("Could not create database indexes: %s", e)
 
 def get_top_users(limit=5):
-    """Get top users by files sequenced"""
-    return users_collection.find().sort("files_sequenced", -1).limit(limit)
+    """Get top users by files sequenced (blocking; run it off the event loop)"""
+    cursor = users_collection.find(
+        {}, {"username": 1, "files_sequenced": 1, "_id": 0}
+    ).sort("files_sequenced", -1).limit(limit)
+    return list(cursor)
 
 def get_total_users():
-    """Get total number of users"""
-    return users_collection.count_documents({})
+    """Approximate user count from collection metadata (no scan)"""
+    return users_collection.estimated_document_count()
 
-def get_all_users():
-    """Get all users for broadcasting"""
-    return list(users_collection.find({}))
+def iter_user_id_batches(batch_size=500):
+    """Yield lists of user ids, streamed from the server batch_size documents at a time"""
+    cursor = users_collection.find(
+        {"user_id": {"$ne": None}}, {"user_id": 1, "_id": 0}
+    ).batch_size(batch_size)
+    batch = []
+    for doc in cursor:
+        user_id = doc.get("user_id")
+        if user_id is None:
+            continue
+        batch.append(user_id)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 def save_broadcast_stats(total, success, failed, blocked):
     """Save broadcast statistics"""
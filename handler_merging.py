@@ -1,8 +1,11 @@
 import os
 import asyncio
+import logging
 import tempfile
 import time
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import Dict, Optional, Tuple
 from pyrogram import Client, filters
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message
 from config import OWNER_ID
@@ -10,13 +13,15 @@ from start import is_subscribed
 
 # Import from merging.py
 from merging import (
-    MergingState, merging_users, PROCESSING_STATES, LAST_EDIT_TIME,
+    MergingState, merging_users, PROCESSING_STATES,
     get_file_extension, match_files_by_episode, merge_audio_subtitles_simple,
-    smart_progress_callback, cleanup_user_throttling,
-    get_merging_help_text,
-    silent_cleanup
+    smart_progress_callback, cleanup_user_throttling, throttled_edit, status_edit, STATUS_EDIT_INTERVAL,
+    get_merging_help_text, pick_temp_root, parallel_download,
+    silent_cleanup, silent_cleanup_async
 )
 
+logger = logging.getLogger(__name__)
+
 async def start_merging_process(client: Client, state: MergingState, message: Message):
     """Start the merging process"""
     user_id = state.user_id
@@ -43,6 +48,55 @@ async def start_merging_process(client: Client, state: MergingState, message: Me
     # Start the merging process in background  
     asyncio.create_task(process_merging(client, state, progress_msg))
 
+async def download_pair(client: Client, temp_path: Path, idx: int, source_data: Dict, target_data: Dict,
+                        progress=None) -> Tuple[Optional[str], Optional[str]]:
+    """Download a source/target pair concurrently; progress(which, current, total) is optional"""
+    source_file_path = str(temp_path / f"source_{idx}{get_file_extension(source_data['filename'])}")
+    target_file_path = str(temp_path / f"target_{idx}{get_file_extension(target_data['filename'])}")
+    
+    source_progress = target_progress = None
+    if progress:
+        async def source_progress(current, total):
+            await progress("source", current, total)
+        
+        async def target_progress(current, total):
+            await progress("target", current, total)
+    
+    tasks = [
+        asyncio.create_task(parallel_download(
+            client, source_data["message"], source_file_path,
+            source_data.get("file_size"), progress=source_progress
+        )),
+        asyncio.create_task(parallel_download(
+            client, target_data["message"], target_file_path,
+            target_data.get("file_size"), progress=target_progress
+        )),
+    ]
+    try:
+        source_file, target_file = await asyncio.gather(*tasks)
+    finally:
+        # If one side fails or the user cancels, don't leave the other writing into temp_path
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return source_file, target_file
+
+@asynccontextmanager
+async def merge_workspace(needed_bytes: int):
+    """Yield (temp_path, prefetch) for one merge run.
+
+    prefetch maps idx -> background download of that pair. On exit those tasks are cancelled
+    and awaited before the directory is removed, so no download writes into a deleted path.
+    """
+    prefetch = {}
+    with tempfile.TemporaryDirectory(dir=pick_temp_root(needed_bytes)) as temp_dir:
+        try:
+            yield Path(temp_dir), prefetch
+        finally:
+            for task in prefetch.values():
+                task.cancel()
+            await asyncio.gather(*prefetch.values(), return_exceptions=True)
+
 async def process_merging(client: Client, state: MergingState, progress_msg: Message):
     """Process the merging of all files with cancellation support"""
     user_id = state.user_id
@@ -56,13 +110,17 @@ async def process_merging(client: Client, state: MergingState, progress_msg: Mes
     }
     
     # Clear any previous edit time for this user
-    if user_id in LAST_EDIT_TIME:
-        del LAST_EDIT_TIME[user_id]
+    cleanup_user_throttling(user_id)
     
     try:  
-        # Create temporary directory  
-        with tempfile.TemporaryDirectory() as temp_dir:  
-            temp_path = Path(temp_dir)  
+        # Peak usage is the current pair, its merged output and the prefetched next pair (~3x a pair)
+        largest_pair = (
+            max((f.get("file_size") or 0 for f in state.source_files), default=0)
+            + max((f.get("file_size") or 0 for f in state.target_files), default=0)
+        )
+        
+        # Create temporary directory (tmpfs when it has room) and the background-download map
+        async with merge_workspace(3 * largest_pair) as (temp_path, prefetch):
               
             # Check cancellation before starting
             if PROCESSING_STATES[user_id].get("cancelled"):
@@ -78,14 +136,14 @@ async def process_merging(client: Client, state: MergingState, progress_msg: Mes
             valid_pairs = [(s, t) for s, t in matched_pairs if s is not None]  
               
             if not valid_pairs:  
-                await progress_msg.edit_text(  
+                await status_edit(progress_msg,
                     "<blockquote>❌ No matching episodes found!</blockquote>\n\n"  
                     "<blockquote>Could not match source and target files by season/episode.</blockquote>"  
                 )  
                 return  
             
             # Send initial count info with cancel button
-            await progress_msg.edit_text(
+            await status_edit(progress_msg,
                 f"<blockquote><b>📊 Files Matched</b></blockquote>\n\n"
                 f"<blockquote>Total pairs: {len(valid_pairs)}</blockquote>\n"
                 f"<blockquote>Skipped (no match): {len(matched_pairs) - len(valid_pairs)}</blockquote>\n\n"
@@ -107,88 +165,53 @@ async def process_merging(client: Client, state: MergingState, progress_msg: Mes
                     
                     overall_progress = f"{idx}/{len(valid_pairs)}"
                     
-                    # --- SOURCE DOWNLOAD ---  
-                    source_filename = f"source_{idx}{get_file_extension(source_data['filename'])}"  
-                    source_file_path = str(temp_path / source_filename)
+                    # --- SOURCE + TARGET DOWNLOAD (concurrent) ---  
+                    pending = prefetch.pop(idx, None)
                     start_time = time.time()  
                       
-                    await progress_msg.edit_text(  
-                        f"<blockquote><b>⬇️ Downloading Source ({overall_progress})</b></blockquote>\n\n"
+                    await throttled_edit(progress_msg, user_id,
+                        f"<blockquote><b>⬇️ Downloading Source & Target ({overall_progress})</b></blockquote>\n\n"
                         f"<blockquote>📁 {source_data['filename']}</blockquote>\n"
-                        f"<blockquote>Will be used for audio & subtitle tracks</blockquote>\n\n"
-                        f"<blockquote>Status: Starting download...</blockquote>",
-                        reply_markup=InlineKeyboardMarkup([
-                            [InlineKeyboardButton("❌ Cancel Processing", callback_data=f"cancel_processing_{user_id}")]
-                        ])
-                    )  
-                      
-                    # FIXED: Use a proper async callback function
-                    async def source_progress(current, total):
-                        await smart_progress_callback(
-                            current, total, progress_msg, start_time,
-                            f"⬇️ Source ({overall_progress})", 
-                            source_data["filename"], user_id, msg_id
-                        )
-                    
-                    source_file = await client.download_media(  
-                        source_data["message"],  
-                        file_name=source_file_path,  
-                        progress=source_progress
-                    )  
-                      
-                    if not source_file:  
-                        print(f"Failed to download source file {idx}")  
-                        await progress_msg.edit_text(
-                            f"<blockquote><b>❌ Download Failed</b></blockquote>\n\n"
-                            f"<blockquote>📁 {source_data['filename']}</blockquote>\n"
-                            f"<blockquote>Skipping to next file...</blockquote>",
-                            reply_markup=InlineKeyboardMarkup([
-                                [InlineKeyboardButton("❌ Cancel Processing", callback_data=f"cancel_processing_{user_id}")]
-                            ])
-                        )
-                        continue  
-                    
-                    # Check cancellation after source download
-                    if PROCESSING_STATES[user_id].get("cancelled"):
-                        # Cleanup before exiting
-                        silent_cleanup(source_file)
-                        raise asyncio.CancelledError("Processing cancelled by user")
-                    
-                    # --- TARGET DOWNLOAD ---  
-                    target_filename = f"target_{idx}{get_file_extension(target_data['filename'])}"  
-                    target_file_path = str(temp_path / target_filename)
-                    start_time = time.time()  
-                    
-                    await progress_msg.edit_text(  
-                        f"<blockquote><b>⬇️ Downloading Target ({overall_progress})</b></blockquote>\n\n"
                         f"<blockquote>📁 {target_data['filename']}</blockquote>\n\n"
-                        f"<blockquote>Status: Starting download...</blockquote>",
+                        f"<blockquote>Status: {'Finishing background download...' if pending else 'Starting download...'}</blockquote>",
                         reply_markup=InlineKeyboardMarkup([
                             [InlineKeyboardButton("❌ Cancel Processing", callback_data=f"cancel_processing_{user_id}")]
-                        ])
+                        ]),
+                        min_interval=STATUS_EDIT_INTERVAL
                     )  
-                      
-                    # FIXED: Use a proper async callback function
-                    async def target_progress(current, total):
-                        await smart_progress_callback(
-                            current, total, progress_msg, start_time,
-                            f"⬇️ Target ({overall_progress})", 
-                            target_data["filename"], user_id, msg_id
-                        )
                     
-                    target_file = await client.download_media(  
-                        target_data["message"],  
-                        file_name=target_file_path,  
-                        progress=target_progress
-                    )  
+                    if pending:
+                        # Already fetching since the previous pair started merging
+                        source_file, target_file = await pending
+                    else:
+                        # Both transfers report into one combined progress bar
+                        transferred = {
+                            "source": (0, source_data.get("file_size") or 0),
+                            "target": (0, target_data.get("file_size") or 0),
+                        }
+                        
+                        async def report_progress(which, current, total):
+                            transferred[which] = (current, total)
+                            await smart_progress_callback(
+                                sum(c for c, _ in transferred.values()),
+                                sum(t for _, t in transferred.values()),
+                                progress_msg, start_time,
+                                f"⬇️ Source + Target ({overall_progress})", 
+                                target_data["filename"], user_id, msg_id
+                            )
+                        
+                        source_file, target_file = await download_pair(
+                            client, temp_path, idx, source_data, target_data, progress=report_progress
+                        )
                       
-                    if not target_file:  
-                        print(f"Failed to download target file {idx}")  
-                        # Cleanup downloaded source file
-                        silent_cleanup(source_file)
-                        await progress_msg.edit_text(
+                    if not source_file or not target_file:  
+                        failed = source_data if not source_file else target_data
+                        logger.warning("Failed to download %s file %d", 'source' if not source_file else 'target', idx)  
+                        # Cleanup whichever file did arrive
+                        silent_cleanup(source_file, target_file)
+                        await status_edit(progress_msg,
                             f"<blockquote><b>❌ Download Failed</b></blockquote>\n\n"
-                            f"<blockquote>📁 {target_data['filename']}</blockquote>\n"
+                            f"<blockquote>📁 {failed['filename']}</blockquote>\n"
                             f"<blockquote>Skipping to next file...</blockquote>",
                             reply_markup=InlineKeyboardMarkup([
                                 [InlineKeyboardButton("❌ Cancel Processing", callback_data=f"cancel_processing_{user_id}")]
@@ -196,24 +219,31 @@ async def process_merging(client: Client, state: MergingState, progress_msg: Mes
                         )
                         continue  
                       
-                    # Check cancellation after target download
+                    # Check cancellation after downloads
                     if PROCESSING_STATES[user_id].get("cancelled"):
                         # Cleanup both files before exiting
                         silent_cleanup(source_file, target_file)
                         raise asyncio.CancelledError("Processing cancelled by user")
+                    
+                    # Fetch the next pair in the background while this one merges and uploads
+                    if idx < len(valid_pairs):
+                        next_source, next_target = valid_pairs[idx]
+                        prefetch[idx + 1] = asyncio.create_task(
+                            download_pair(client, temp_path, idx + 1, next_source, next_target)
+                        )
                       
                     # Output file path - keep original target filename  
                     output_filename = target_data["filename"]  
                     output_file = str(temp_path / output_filename)  
                       
-                    print(f"\n=== Processing pair {idx} ===")  
-                    print(f"  Source: {source_data['filename']}")  
-                    print(f"  Target: {target_data['filename']}")  
-                    print(f"  Output: {output_filename}")  
+                    logger.info("=== Processing pair %d ===", idx)
+                    logger.info("  Source: %s", source_data['filename'])
+                    logger.info("  Target: %s", target_data['filename'])
+                    logger.info("  Output: %s", output_filename)
                       
                     # --- STABLE MERGE STAGE ---  
                     merge_start_time = time.time()  
-                    await progress_msg.edit_text(  
+                    await throttled_edit(progress_msg, user_id,
                         f"<blockquote><b>🛠️ Stable Merging ({overall_progress})</b></blockquote>\n\n"  
                         f"<blockquote>📁 {output_filename}</blockquote>\n\n"
                         f"<blockquote>Step 1: Analyzing files...</blockquote>\n"
@@ -224,34 +254,16 @@ async def process_merging(client: Client, state: MergingState, progress_msg: Mes
                         "<blockquote>Step 6: Finalizing output</blockquote>",
                         reply_markup=InlineKeyboardMarkup([
                             [InlineKeyboardButton("❌ Cancel Processing", callback_data=f"cancel_processing_{user_id}")]
-                        ])
+                        ]),
+                        min_interval=STATUS_EDIT_INTERVAL
                     )  
                     
-                    # Run stable merge in thread
+                    # Run stable merge as a task; ffmpeg is an async subprocess so the loop stays free
                     merge_success = False
+                    merge_task = asyncio.create_task(
+                        merge_audio_subtitles_simple(source_file, target_file, output_file)
+                    )
                     try:
-                        import threading
-                        from queue import Queue
-                        
-                        result_queue = Queue()
-                        
-                        def run_stable_merge():
-                            try:
-                                # Check cancellation during merge
-                                if PROCESSING_STATES.get(user_id, {}).get("cancelled"):
-                                    result_queue.put(("cancelled", None))
-                                    return
-                                    
-                                success = merge_audio_subtitles_simple(source_file, target_file, output_file)
-                                result_queue.put(("success", success))
-                            except Exception as e:
-                                result_queue.put(("error", str(e)))
-                        
-                        # Start merge thread
-                        merge_thread = threading.Thread(target=run_stable_merge)
-                        merge_thread.daemon = True
-                        merge_thread.start()
-                        
                         # Update merge progress periodically
                         merge_steps = [
                             "Analyzing files",
@@ -265,11 +277,13 @@ async def process_merging(client: Client, state: MergingState, progress_msg: Mes
                         step_idx = 0
                         last_step_time = time.time()
                         
-                        while merge_thread.is_alive():
+                        while not merge_task.done():
                             # Check cancellation
                             if PROCESSING_STATES[user_id].get("cancelled"):
-                                # Cleanup files before exiting
-                                silent_cleanup(source_file, target_file)
+                                # Stop ffmpeg, then cleanup files before exiting
+                                merge_task.cancel()
+                                await asyncio.wait({merge_task})
+                                silent_cleanup(source_file, target_file, output_file)
                                 raise asyncio.CancelledError("Processing cancelled by user")
                             
                             # Rotate through steps every 5 seconds for visual feedback
@@ -286,62 +300,44 @@ async def process_merging(client: Client, state: MergingState, progress_msg: Mes
                                 f"<blockquote>Audio Sync: Guaranteed ✓</blockquote>\n"
                                 f"<blockquote>Method: Direct Mapping ✓</blockquote>"
                             )
-                            try:
-                                await progress_msg.edit_text(
-                                    progress_text,
-                                    reply_markup=InlineKeyboardMarkup([
-                                        [InlineKeyboardButton("❌ Cancel Processing", callback_data=f"cancel_processing_{user_id}")]
-                                    ])
-                                )
-                            except:
-                                pass
-                            await asyncio.sleep(2)
+                            await throttled_edit(
+                                progress_msg, user_id, progress_text,
+                                reply_markup=InlineKeyboardMarkup([
+                                    [InlineKeyboardButton("❌ Cancel Processing", callback_data=f"cancel_processing_{user_id}")]
+                                ]),
+                                min_interval=STATUS_EDIT_INTERVAL
+                            )
+                            # Wake early as soon as the merge finishes
+                            await asyncio.wait({merge_task}, timeout=2)
                         
-                        # Get result
-                        if not result_queue.empty():
-                            result_type, result = result_queue.get()
-                            if result_type == "success":
-                                merge_success = result
-                            elif result_type == "cancelled":
-                                # Cleanup files
-                                silent_cleanup(source_file, target_file)
-                                raise asyncio.CancelledError("Processing cancelled by user")
-                            else:
-                                print(f"Merge error: {result}")
-                                merge_success = False
-                        else:
-                            merge_success = False
+                        merge_success = merge_task.result()
                             
                     except Exception as e:
-                        print(f"Merge thread error: {str(e)}")
+                        logger.exception("Merge error: %s", e)
                         merge_success = False
                       
                     # Check cancellation after merge
                     if PROCESSING_STATES[user_id].get("cancelled"):
                         # Cleanup all files
-                        silent_cleanup(source_file, target_file, output_file if os.path.exists(output_file) else None)
+                        silent_cleanup(source_file, target_file, output_file)
                         raise asyncio.CancelledError("Processing cancelled by user")
                       
                     if merge_success:  
-                        # Delete source and target files after successful merge
-                        print(f"✅ Merge successful. Cleaning up source and target files...")
-                        deleted_count = silent_cleanup(source_file, target_file)
-                        print(f"✅ Cleaned up {deleted_count} files")
+                        # Delete source and target files after successful merge (overlaps the upload)
+                        logger.info("✅ Merge successful. Cleaning up source and target files...")
+                        inputs_cleanup = asyncio.create_task(silent_cleanup_async(source_file, target_file))
                         
                         # --- UPLOAD STAGE ---  
                         start_time = time.time()  
                         
-                        # Clear throttle for upload
-                        if user_id in LAST_EDIT_TIME:
-                            del LAST_EDIT_TIME[user_id]
-                          
-                        await progress_msg.edit_text(  
+                        await throttled_edit(progress_msg, user_id,
                             f"<blockquote><b>⬆️ Uploading ({overall_progress})</b></blockquote>\n\n"
                             f"<blockquote>📁 {output_filename}</blockquote>\n\n"
                             f"<blockquote>Status: Starting upload...</blockquote>",
                             reply_markup=InlineKeyboardMarkup([
                                 [InlineKeyboardButton("❌ Cancel Processing", callback_data=f"cancel_processing_{user_id}")]
-                            ])
+                            ]),
+                            min_interval=STATUS_EDIT_INTERVAL
                         )  
                           
                         # FIXED: Use a proper async callback function for upload
@@ -369,12 +365,12 @@ async def process_merging(client: Client, state: MergingState, progress_msg: Mes
                         )  
                         
                         # Delete merged file immediately after successful upload
-                        print(f"✅ Upload successful. Cleaning up merged file...")
-                        deleted_count = silent_cleanup(output_file)
-                        print(f"✅ Cleaned up merged file")
+                        logger.info("✅ Upload successful. Cleaning up merged file...")
+                        deleted_count = await inputs_cleanup + await silent_cleanup_async(output_file)
+                        logger.info("✅ Cleaned up %d files", deleted_count)
                           
                         # --- FINAL STATUS FOR THIS FILE ---  
-                        await progress_msg.edit_text(  
+                        await throttled_edit(progress_msg, user_id,
                             f"<blockquote><b>✅ Stable Merge Completed ({overall_progress})</b></blockquote>\n\n"  
                             f"<blockquote>📁 {output_filename}</blockquote>\n"
                             f"<blockquote>🎯 Target video: Preserved ✓</blockquote>\n"
@@ -384,16 +380,17 @@ async def process_merging(client: Client, state: MergingState, progress_msg: Mes
                             f"<blockquote>⏱️ Audio Sync: Perfect ✓</blockquote>",
                             reply_markup=InlineKeyboardMarkup([
                                 [InlineKeyboardButton("❌ Cancel Processing", callback_data=f"cancel_processing_{user_id}")]
-                            ])
+                            ]),
+                            min_interval=STATUS_EDIT_INTERVAL
                         )  
                           
-                        print(f"Successfully merged file {idx}")  
+                        logger.info("Successfully merged file %d", idx)  
                     else:  
                         # Cleanup downloaded files if merge failed
                         silent_cleanup(source_file, target_file)
-                        print(f"✅ Cleaned up source and target files after failed merge")
+                        logger.info("✅ Cleaned up source and target files after failed merge")
                         
-                        await progress_msg.edit_text(  
+                        await status_edit(progress_msg,
                             f"<blockquote><b>❌ Merge Failed ({overall_progress})</b></blockquote>\n\n"  
                             f"<blockquote>📁 {target_data['filename']}</blockquote>\n"  
                             f"<blockquote>⚠️ This file may be incompatible or corrupted</blockquote>",
@@ -401,25 +398,25 @@ async def process_merging(client: Client, state: MergingState, progress_msg: Mes
                                 [InlineKeyboardButton("❌ Cancel Processing", callback_data=f"cancel_processing_{user_id}")]
                             ])
                         )  
-                        print(f"Failed to merge file {idx}")  
+                        logger.warning("Failed to merge file %d", idx)  
                       
                 except asyncio.CancelledError as e:
                     # User cancelled processing - files already cleaned up in individual checks
-                    print(f"Processing cancelled by user for file {idx}")
+                    logger.info("Processing cancelled by user for file %d", idx)
                     raise e  # Re-raise to exit loop
                 except Exception as e:  
-                    print(f"Error processing file {idx}: {str(e)}")  
+                    logger.exception("Error processing file %d: %s", idx, e)  
                     
                     # Ensure cleanup even on unexpected errors
                     try:
                         # Cleanup any files that might exist
                         if 'source_file' in locals(): silent_cleanup(source_file)
                         if 'target_file' in locals(): silent_cleanup(target_file)
-                        if 'output_file' in locals() and os.path.exists(output_file): silent_cleanup(output_file)
+                        if 'output_file' in locals(): silent_cleanup(output_file)
                     except:
                         pass
                     
-                    await progress_msg.edit_text(  
+                    await status_edit(progress_msg,
                         f"<blockquote><b>❌ Processing Error ({idx}/{len(valid_pairs)})</b></blockquote>\n\n"  
                         f"<blockquote>📁 {target_data['filename']}</blockquote>\n"  
                         f"<blockquote>⚠️ Error: {str(e)[:100]}</blockquote>",
@@ -427,16 +424,10 @@ async def process_merging(client: Client, state: MergingState, progress_msg: Mes
                             [InlineKeyboardButton("❌ Cancel Processing", callback_data=f"cancel_processing_{user_id}")]
                         ])
                     )  
-                  
-                # Clear throttle before next file
-                if user_id in LAST_EDIT_TIME:
-                    del LAST_EDIT_TIME[user_id]
-                
-                # Small delay to avoid flooding  
-                await asyncio.sleep(1)  
+
               
             # Final completion message  
-            await progress_msg.edit_text(  
+            await status_edit(progress_msg,
                 "<blockquote><b>✅ All Stable Merges Completed</b></blockquote>\n\n"  
                 "<blockquote>🎉 All merged files have been sent to you!</blockquote>\n\n"
                 "<blockquote>🔧 <b>Stable Method Summary:</b></blockquote>\n"
@@ -454,19 +445,17 @@ async def process_merging(client: Client, state: MergingState, progress_msg: Mes
               
     except asyncio.CancelledError:
         # Handle cancellation
-        print(f"Merging cancelled for user {user_id}")
-        await progress_msg.edit_text(  
+        logger.info("Merging cancelled for user %s", user_id)
+        await status_edit(progress_msg,
             "<blockquote><b>❌ Processing Cancelled</b></blockquote>\n\n"  
             "<blockquote>🚫 Merging process was cancelled by user.</blockquote>\n"
             "<blockquote>All temporary files have been cleaned up.</blockquote>\n"
             "<blockquote>Use <code>/merging</code> to start again.</blockquote>"  
         )
     except Exception as e:  
-        print(f"Merge process error: {str(e)}")  
-        import traceback  
-        traceback.print_exc()  
+        logger.exception("Merge process error: %s", e)
         try:  
-            await progress_msg.edit_text(  
+            await status_edit(progress_msg,
                 "<blockquote>❌ An error occurred during merging.</blockquote>\n"  
                 "<blockquote>Please try again with different files.</blockquote>"  
             )  
@@ -477,8 +466,7 @@ async def process_merging(client: Client, state: MergingState, progress_msg: Mes
         # Clean up processing state
         if user_id in PROCESSING_STATES:
             del PROCESSING_STATES[user_id]
-        if user_id in LAST_EDIT_TIME:
-            del LAST_EDIT_TIME[user_id]
+        cleanup_user_throttling(user_id)
         if user_id in merging_users:  
             del merging_users[user_id]
                         
@@ -578,24 +566,32 @@ def setup_merging_handlers(app: Client):
             "mime_type": mime_type
         }
         
-        if state.state == "waiting_for_source":
-            state.source_files.append(file_data)
-            
+        # Append under the lock so a concurrent /done can't flip the step mid-append
+        async with state.lock:
+            step = state.state
+            if step == "waiting_for_source":
+                state.source_files.append(file_data)
+                count = len(state.source_files)
+            elif step == "waiting_for_target":
+                state.target_files.append(file_data)
+                count = len(state.target_files)
+            else:
+                return
+        
+        if step == "waiting_for_source":
             # Send confirmation
-            if len(state.source_files) % 3 == 0 or len(state.source_files) == 1:
+            if count % 3 == 0 or count == 1:
                 await message.reply_text(
-                    f"<blockquote>📥 Received {len(state.source_files)} source files.</blockquote>\n"
+                    f"<blockquote>📥 Received {count} source files.</blockquote>\n"
                     f"<blockquote>Send <code>/done</code> when finished with source files.</blockquote>\n"
                     f"<blockquote><i>Note: Source audio will be re-encoded to AAC 128k</i></blockquote>"
                 )
                 
-        elif state.state == "waiting_for_target":
-            state.target_files.append(file_data)
-            
+        else:
             # Send confirmation
-            if len(state.target_files) % 3 == 0 or len(state.target_files) == 1:
+            if count % 3 == 0 or count == 1:
                 await message.reply_text(
-                    f"<blockquote>📥 Received {len(state.target_files)} target files.</blockquote>\n"
+                    f"<blockquote>📥 Received {count} target files.</blockquote>\n"
                     f"<blockquote>Send <code>/done</code> when finished with target files.</blockquote>\n"
                     f"<blockquote><i>Note: Original video & audio will be preserved</i></blockquote>"
                 )
@@ -616,53 +612,55 @@ def setup_merging_handlers(app: Client):
         
         state = merging_users[user_id]
         
-        if state.state == "waiting_for_source":
-            if not state.source_files:
+        # One /done at a time per user - stops double starts from repeated commands
+        async with state.lock:
+            if state.state == "waiting_for_source":
+                if not state.source_files:
+                    await message.reply_text(
+                        "<blockquote>❌ No source files received yet.</blockquote>\n"
+                        "<blockquote>Please send source files first.</blockquote>"
+                    )
+                    return
+            
+                state.state = "waiting_for_target"
+            
                 await message.reply_text(
-                    "<blockquote>❌ No source files received yet.</blockquote>\n"
-                    "<blockquote>Please send source files first.</blockquote>"
+                    f"<blockquote><b>✅ Source files received!</b></blockquote>\n\n"
+                    f"<blockquote>Total source files: {len(state.source_files)}</blockquote>\n\n"
+                    f"<blockquote><b>Now send me the TARGET files.</b></blockquote>\n\n"
+                    f"<blockquote><i>📝 Note: Send the same number of target files</i></blockquote>\n"
+                    f"<blockquote><i>🎯 Target video & audio will be preserved</i></blockquote>"
                 )
-                return
             
-            state.state = "waiting_for_target"
+            elif state.state == "waiting_for_target":
+                if not state.target_files:
+                    await message.reply_text(
+                        "<blockquote>❌ No target files received yet.</blockquote>\n"
+                        "<blockquote>Please send target files first.</blockquote>"
+                    )
+                    return
             
-            await message.reply_text(
-                f"<blockquote><b>✅ Source files received!</b></blockquote>\n\n"
-                f"<blockquote>Total source files: {len(state.source_files)}</blockquote>\n\n"
-                f"<blockquote><b>Now send me the TARGET files.</b></blockquote>\n\n"
-                f"<blockquote><i>📝 Note: Send the same number of target files</i></blockquote>\n"
-                f"<blockquote><i>🎯 Target video & audio will be preserved</i></blockquote>"
-            )
+                # Check if counts match
+                if len(state.source_files) != len(state.target_files):
+                    await message.reply_text(
+                        f"<blockquote>⚠️ File count mismatch!</blockquote>\n\n"
+                        f"<blockquote>Source files: {len(state.source_files)}\n"
+                        f"Target files: {len(state.target_files)}</blockquote>\n\n"
+                        f"<blockquote>You can continue anyway, but only matching episodes will be processed.</blockquote>",
+                        reply_markup=InlineKeyboardMarkup([
+                            [InlineKeyboardButton("✅ Continue Anyway", callback_data="continue_merge")],
+                            [InlineKeyboardButton("❌ Cancel", callback_data="cancel_merge")]
+                        ])
+                    )
+                    return
             
-        elif state.state == "waiting_for_target":
-            if not state.target_files:
-                await message.reply_text(
-                    "<blockquote>❌ No target files received yet.</blockquote>\n"
-                    "<blockquote>Please send target files first.</blockquote>"
-                )
-                return
+                # Start processing
+                await start_merging_process(client, state, message)
             
-            # Check if counts match
-            if len(state.source_files) != len(state.target_files):
+            else:
                 await message.reply_text(
-                    f"<blockquote>⚠️ File count mismatch!</blockquote>\n\n"
-                    f"<blockquote>Source files: {len(state.source_files)}\n"
-                    f"Target files: {len(state.target_files)}</blockquote>\n\n"
-                    f"<blockquote>You can continue anyway, but only matching episodes will be processed.</blockquote>",
-                    reply_markup=InlineKeyboardMarkup([
-                        [InlineKeyboardButton("✅ Continue Anyway", callback_data="continue_merge")],
-                        [InlineKeyboardButton("❌ Cancel", callback_data="cancel_merge")]
-                    ])
+                    "<blockquote>❌ Invalid state. Use <code>/cancel_merge</code> to reset.</blockquote>"
                 )
-                return
-            
-            # Start processing
-            await start_merging_process(client, state, message)
-            
-        else:
-            await message.reply_text(
-                "<blockquote>❌ Invalid state. Use <code>/cancel_merge</code> to reset.</blockquote>"
-            )
     
     @app.on_callback_query(filters.regex(r"^(continue_merge|cancel_merge)$"))
     async def merge_control_callback(client, query):
@@ -677,8 +675,13 @@ def setup_merging_handlers(app: Client):
         state = merging_users[user_id]
         
         if action == "continue_merge":
-            await query.message.delete()
-            await start_merging_process(client, state, query.message)
+            async with state.lock:
+                # A second tap must not start another run
+                if state.state == "processing":
+                    await query.answer("Already processing", show_alert=True)
+                    return
+                await query.message.delete()
+                await start_merging_process(client, state, query.message)
             
         elif action == "cancel_merge":
             if user_id in merging_users:
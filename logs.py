@@ -0,0 +1,30 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+
+_configured = False
+
+def setup_logging():
+    """Send log records through a queue; a background thread does the formatting and I/O.
+
+    Safe to call from every entry point; only the first call installs the handler.
+    """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    )
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    listener.start()
+    atexit.register(listener.stop)
@@ -6,13 +6,19 @@ import subprocess
 import json
 import time
 import math
-from pathlib import Path
+import shutil
+import logging
+from collections import deque
+from functools import lru_cache
 from typing import List, Dict, Tuple, Optional
 from pyrogram import Client, filters
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message
-from config import OWNER_ID
+from pyrogram.errors import FloodWait, MessageNotModified
+from config import OWNER_ID, FFMPEG_PATH, FFPROBE_PATH, MAX_CONCURRENT_PROCESSES, PROCESSING_TIMEOUT
 from start import is_subscribed
 
+logger = logging.getLogger(__name__)
+
 # Merging state management
 merging_users = {}  # Store user's merging state
 
@@ -22,6 +28,26 @@ PROCESSING_STATES = {}
 # Throttling system for multiple users
 LAST_EDIT_TIME = {}
 EDIT_INTERVAL = 1.2  # Minimum 1.2 seconds between updates
+LAST_PROGRESS = {}  # user_id -> (stage, bytes) shown by the last edit
+MIN_PROGRESS_DELTA = 256 * 1024  # Don't edit for less than 256 KB of progress
+STATUS_EDIT_INTERVAL = 3.0  # Merge status text changes slowly; edit it at most every 3s
+STATUS_FLOODWAIT_MAX = 10  # Longest FloodWait a status edit sits out; longer ones skip the edit
+PROGRESS_HEADERS = {}  # user_id -> ((stage, filename), rendered header)
+
+# Progress text is split into a static header (per stage/file) and a format-ready tail
+PROGRESS_HEADER_TEMPLATE = (
+    "<blockquote><b>{stage}</b></blockquote>\n\n"
+    "<blockquote>📁 {filename}</blockquote>\n\n"
+)
+PROGRESS_TAIL_TEMPLATE = (
+    "<blockquote>{bar}</blockquote>\n"
+    "<blockquote>"
+    "» Size  : {current:.1f} MB / {total:.1f} MB\n"
+    "» Done  : {percent:.2f}%\n"
+    "» Speed : {speed:.2f} MB/s\n"
+    "» ETA   : {eta}"
+    "</blockquote>"
+)
 
 class MergingState:
     """Track user's merging state"""
@@ -33,6 +59,7 @@ class MergingState:
         self.current_processing = 0
         self.total_files = 0
         self.progress_msg = None  # Store progress message reference
+        self.lock = asyncio.Lock()  # Serializes file appends and state transitions
 
 def silent_cleanup(*file_paths):
     """
@@ -43,16 +70,21 @@ def silent_cleanup(*file_paths):
     for file_path in file_paths:
         if file_path and isinstance(file_path, str):
             try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    deleted_count += 1
-                    print(f"✓ Cleaned up: {os.path.basename(file_path)}")
+                os.remove(file_path)
+                deleted_count += 1
+                logger.info("✓ Cleaned up: %s", os.path.basename(file_path))
+            except FileNotFoundError:
+                pass
             except Exception as e:
                 # Silent failure - don't raise, just log for debugging
-                print(f"⚠️ Could not delete {file_path}: {e}")
+                logger.warning("⚠️ Could not delete %s: %s", file_path, e)
                 pass
     return deleted_count
 
+async def silent_cleanup_async(*file_paths):
+    """Async variant of silent_cleanup - all unlinks share one worker-thread dispatch"""
+    return await asyncio.to_thread(silent_cleanup, *file_paths)
+
 # --- HELP TEXT UPDATE ---
 def get_merging_help_text() -> str:
     """Get help text for merging commands"""
@@ -128,6 +160,11 @@ async def smart_progress_callback(current, total, msg, start_time, stage, filena
         if time_since_last < EDIT_INTERVAL:
             return  # Skip this update, too soon!
     
+    # Skip if the transfer barely moved since the last edit of this stage
+    last = LAST_PROGRESS.get(user_id)
+    if last and last[0] == stage and current != total and 0 <= current - last[1] < MIN_PROGRESS_DELTA:
+        return
+    
     diff = now - start_time
     
     if diff == 0 or total == 0:
@@ -137,17 +174,20 @@ async def smart_progress_callback(current, total, msg, start_time, stage, filena
     percent = current * 100 / total
     eta = (total - current) / speed if speed > 0 else 0
     
+    # Reuse the rendered header while stage and filename stay the same
+    header = PROGRESS_HEADERS.get(user_id)
+    if header is None or header[0] != (stage, filename):
+        header = ((stage, filename), PROGRESS_HEADER_TEMPLATE.format(stage=stage, filename=filename))
+        PROGRESS_HEADERS[user_id] = header
+    
     # Build message text
-    text = (
-        f"<blockquote><b>{stage}</b></blockquote>\n\n"
-        f"<blockquote>📁 {filename}</blockquote>\n\n"
-        f"<blockquote>{make_bar(percent)}</blockquote>\n"
-        f"<blockquote>"
-        f"» Size  : {current/1024/1024:.1f} MB / {total/1024/1024:.1f} MB\n"
-        f"» Done  : {percent:.2f}%\n"
-        f"» Speed : {speed/1024/1024:.2f} MB/s\n"
-        f"» ETA   : {format_eta(eta)}"
-        f"</blockquote>"
+    text = header[1] + PROGRESS_TAIL_TEMPLATE.format(
+        bar=make_bar(percent),
+        current=current / 1048576,
+        total=total / 1048576,
+        percent=percent,
+        speed=speed / 1048576,
+        eta=format_eta(eta)
     )
     
     # Add cancel button if we have user_id
@@ -160,48 +200,150 @@ async def smart_progress_callback(current, total, msg, start_time, stage, filena
     try:
         await msg.edit_text(text, reply_markup=reply_markup)
         LAST_EDIT_TIME[user_id] = now  # Update last edit time
+        LAST_PROGRESS[user_id] = (stage, current)
     except Exception as e:
         # If message was deleted or other error, skip updating last edit time
         pass
 
+async def throttled_edit(msg, user_id, text, reply_markup=None, min_interval=EDIT_INTERVAL) -> bool:
+    """Edit a status message unless this user's last edit was under min_interval ago"""
+    now = time.time()
+    if now - LAST_EDIT_TIME.get(user_id, 0) < min_interval:
+        return False
+    try:
+        await msg.edit_text(text, reply_markup=reply_markup)
+        LAST_EDIT_TIME[user_id] = now
+        return True
+    except Exception:
+        # Deleted message / unchanged text - try again on the next tick
+        return False
+
+async def status_edit(msg, text, reply_markup=None):
+    """Edit a status message; waits out one short FloodWait, skips the edit on a long one"""
+    for attempt in range(2):
+        try:
+            return await msg.edit_text(text, reply_markup=reply_markup)
+        except FloodWait as e:
+            if attempt or e.value > STATUS_FLOODWAIT_MAX:
+                # A status line isn't worth stalling the merge for
+                logger.warning("Skipping status edit after FloodWait of %ss", e.value)
+                return None
+            await asyncio.sleep(e.value)
+        except MessageNotModified:
+            return None
+
 # Cleanup function to remove user from throttling system
 def cleanup_user_throttling(user_id):
     """Remove user from throttling system when done"""
-    if user_id in LAST_EDIT_TIME:
-        del LAST_EDIT_TIME[user_id]
+    LAST_EDIT_TIME.pop(user_id, None)
+    LAST_PROGRESS.pop(user_id, None)
+    PROGRESS_HEADERS.pop(user_id, None)
+
+# --- TEMP STORAGE ---
+# Optional tmpfs for merge jobs (e.g. MERGE_TMPFS=/dev/shm) keeps downloaded/merged files in RAM.
+# Off by default: tmpfs pages count against the container's memory limit, so only enable it
+# on hosts with RAM to spare for ~3x the largest file pair.
+MERGE_TMPFS = os.environ.get("MERGE_TMPFS", "")
+
+def pick_temp_root(required_bytes: int) -> Optional[str]:
+    """Return MERGE_TMPFS if set and the job fits in half of its free space, else None (disk default)"""
+    if not MERGE_TMPFS or not os.path.isdir(MERGE_TMPFS):
+        return None
+    try:
+        st = os.statvfs(MERGE_TMPFS)
+    except OSError:
+        return None
+    if required_bytes > (st.f_bavail * st.f_frsize) // 2:
+        return None
+    return MERGE_TMPFS
+
+# --- PARALLEL DOWNLOAD ---
+DOWNLOAD_WORKERS = 4
+STREAM_CHUNK = 1024 * 1024  # stream_media yields 1 MiB chunks; offset/limit count chunks
+
+async def parallel_download(client: Client, message: Message, file_path: str,
+                            file_size: Optional[int], progress=None) -> Optional[str]:
+    """Download with several ranged stream_media workers, falling back to download_media"""
+    if not file_size or file_size <= STREAM_CHUNK * DOWNLOAD_WORKERS:
+        return await client.download_media(message, file_name=file_path, progress=progress)
+    
+    total_chunks = math.ceil(file_size / STREAM_CHUNK)
+    per_worker = math.ceil(total_chunks / DOWNLOAD_WORKERS)
+    received = 0
+    
+    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        try:
+            os.posix_fallocate(fd, 0, file_size)
+        except (AttributeError, OSError):
+            pass
+        
+        async def worker(first_chunk: int):
+            nonlocal received
+            offset = first_chunk * STREAM_CHUNK
+            async for chunk in client.stream_media(message, offset=first_chunk, limit=per_worker):
+                # pwrite keeps workers from fighting over a shared file offset
+                os.pwrite(fd, chunk, offset)
+                offset += len(chunk)
+                received += len(chunk)
+                if progress:
+                    await progress(received, file_size)
+        
+        tasks = [asyncio.create_task(worker(first)) for first in range(0, total_chunks, per_worker)]
+        error = None
+        try:
+            await asyncio.gather(*tasks)
+        except Exception as e:
+            # A transfer error; CancelledError (user cancel) is not caught and propagates
+            error = e
+        finally:
+            # Stop the other workers before the fd they write to is closed
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        os.close(fd)
+    
+    if error or received != file_size:
+        logger.warning("Parallel download incomplete (%s), retrying with download_media",
+                       error or f"{received}/{file_size} bytes")
+        return await client.download_media(message, file_name=file_path, progress=progress)
+    return file_path
 
 # --- PARSING ENGINE FOR EPISODE MATCHING ---
+# Maps "." and "_" separators to spaces in a single C-level pass
+_NORM_TABLE = str.maketrans("._", "  ")
+
+# Tried in order; two-group patterns capture (season, episode), one-group just the episode
+_EPISODE_PATTERNS = tuple(re.compile(p) for p in (
+    # S01E01, S1 E1, S01-E01
+    r's\s*(\d{1,2})\s*e\s*(\d{1,3})',
+    # S1 - 01, S01 01, S2_12
+    r's\s*(\d{1,2})\s*[- ]\s*(\d{1,3})',
+    # Season 1 Episode 01
+    r'season\s*(\d{1,2})\s*(?:episode|ep)?\s*(\d{1,3})',
+    # 1x01
+    r'(\d{1,2})\s*x\s*(\d{1,3})',
+    # Episode 01, EP01, E01
+    r'(?:episode|ep|e)\s*(\d{1,3})',
+))
+_BARE_NUMBER = re.compile(r'\b(\d{1,3})\b')
+
 def parse_episode_info(filename: str) -> Dict:
     """
     Smart season/episode parser
     Supports: S1-01, S01E01, 1x01, EP01, Episode 01, etc.
     """
-    name = filename.lower()
-
-    # normalize separators
-    name = re.sub(r'[._]', ' ', name)
-    name = re.sub(r'\s+', ' ', name)
+    # normalize separators and collapse whitespace without the regex engine
+    name = " ".join(filename.lower().translate(_NORM_TABLE).split())
 
     season = None
     episode = None
 
-    patterns = [
-        # S01E01, S1 E1, S01-E01
-        r's\s*(\d{1,2})\s*e\s*(\d{1,3})',
-        # S1 - 01, S01 01, S2_12
-        r's\s*(\d{1,2})\s*[- ]\s*(\d{1,3})',
-        # Season 1 Episode 01
-        r'season\s*(\d{1,2})\s*(?:episode|ep)?\s*(\d{1,3})',
-        # 1x01
-        r'(\d{1,2})\s*x\s*(\d{1,3})',
-        # Episode 01, EP01, E01
-        r'(?:episode|ep|e)\s*(\d{1,3})',
-    ]
-
-    for p in patterns:
-        m = re.search(p, name)
+    for pattern in _EPISODE_PATTERNS:
+        m = pattern.search(name)
         if m:
-            if len(m.groups()) == 2:
+            if pattern.groups == 2:
                 season = int(m.group(1))
                 episode = int(m.group(2))
             else:
@@ -210,7 +352,7 @@ def parse_episode_info(filename: str) -> Dict:
 
     # fallback: standalone episode number (LAST option)
     if episode is None:
-        m = re.search(r'\b(\d{1,3})\b', name)
+        m = _BARE_NUMBER.search(name)
         if m:
             episode = int(m.group(1))
 
@@ -223,132 +365,272 @@ def parse_episode_info(filename: str) -> Dict:
         "episode": episode if episode is not None else 0
     }
 
+@lru_cache(maxsize=1024)
+def episode_key(filename: str) -> Tuple[int, int]:
+    """Cached (season, episode) for a filename - repeated names skip the regex work"""
+    info = parse_episode_info(filename)
+    return info["season"], info["episode"]
+
 def match_files_by_episode(source_files: List[Dict], target_files: List[Dict]) -> List[Tuple[Dict, Dict]]:
     """Match source and target files by season and episode"""
     matched_pairs = []
     
+    # Index sources by (season, episode) once; the first file for a key wins
+    source_index = {}
+    for source in source_files:
+        source_index.setdefault(episode_key(source.get("filename", "")), source)
+    
     for target in target_files:
-        target_info = parse_episode_info(target.get("filename", ""))
+        target_key = episode_key(target.get("filename", ""))
 
         # 🚫 IMPORTANT FIX:
         # Agar episode detect nahi hua, to skip karo
-        if target_info["episode"] == 0:
-            print(f"[SKIP] Episode not detected in target: {target.get('filename')}")
+        if target_key[1] == 0:
+            logger.info("[SKIP] Episode not detected in target: %s", target.get('filename'))
             continue
 
-        # Find matching source file
-        found = False
-        for source in source_files:
-            source_info = parse_episode_info(source.get("filename", ""))
-
-            if (
-                source_info["season"] == target_info["season"] and
-                source_info["episode"] == target_info["episode"]
-            ):
-                matched_pairs.append((source, target))
-                found = True
-                break
-
-        # Agar match nahi mila, to source None rakho
-        if not found:
-            matched_pairs.append((None, target))
+        # Matching source file, ya None agar match nahi mila
+        matched_pairs.append((source_index.get(target_key), target))
     
     return matched_pairs
 
 # --- NEW: STABLE MERGING METHOD ---
-def get_media_info(file_path: str) -> Dict:
-    """Get detailed media information using ffprobe"""
+def _probe_key(file_path: str) -> Tuple[str, int, int]:
+    """Build a cache key that changes whenever the file on disk changes"""
+    st = os.stat(file_path)
+    return (file_path, st.st_mtime_ns, st.st_size)
+
+# Only the fields the merger reads; keeps ffprobe's JSON small on big MKVs
+PROBE_ENTRIES = (
+    "stream=index,codec_type,codec_name,bit_rate,channels,sample_rate,"
+    "duration,start_time,start_pts:stream_tags=language,title:"
+    "format=duration,size,bit_rate,format_name"
+)
+# A stuck ffprobe (bad PATH wrapper, unreadable file) must not hang the caller
+PROBE_TIMEOUT = 30
+
+@lru_cache(maxsize=64)
+def _cached_probe(key: Tuple[str, int, int]) -> Dict:
+    """Run ffprobe once per (path, mtime, size) key"""
     cmd = [
-        'ffprobe',
+        FFPROBE_PATH,
         '-v', 'quiet',
         '-print_format', 'json',
-        '-show_format',
-        '-show_streams',
-        file_path
+        '-show_entries', PROBE_ENTRIES,
+        key[0]
     ]
     
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=PROBE_TIMEOUT)
         if result.returncode == 0:
             return json.loads(result.stdout)
     except Exception as e:
-        print(f"Error getting media info: {e}")
+        logger.error("Error getting media info: %s", e)
     
     return {"streams": [], "format": {}}
 
-def optimized_merge_v2(source_path: str, target_path: str, output_path: str) -> bool:
+def get_media_info(file_path: str) -> Dict:
+    """Get detailed media information using ffprobe (cached per file version)"""
+    try:
+        key = _probe_key(file_path)
+    except OSError as e:
+        logger.error("Error getting media info: %s", e)
+        return {"streams": [], "format": {}}
+    return _cached_probe(key)
+
+# At most MAX_CONCURRENT_PROCESSES ffmpeg merges run at once; the rest queue.
+# Cores are split between them so the box isn't oversubscribed.
+FFMPEG_SEMAPHORE = asyncio.Semaphore(MAX_CONCURRENT_PROCESSES)
+FFMPEG_THREADS = max(1, (os.cpu_count() or 1) // MAX_CONCURRENT_PROCESSES)
+
+# Containers here declare their streams up front; skip ffmpeg's long default analysis
+FAST_PROBE_ARGS = ["-analyzeduration", "1000000", "-probesize", "1000000"]
+
+def _base_ffmpeg_cmd() -> List[str]:
+    """Common ffmpeg prefix: no stdin polling, quiet output"""
+    return [
+        FFMPEG_PATH, "-y",
+        "-nostdin",
+        "-hide_banner",
+        "-loglevel", "error",
+    ]
+
+def source_audio_is_aac(source_path: str) -> bool:
+    """True when every audio stream in the source is already AAC"""
+    codecs = [
+        stream.get("codec_name")
+        for stream in get_media_info(source_path).get("streams", [])
+        if stream.get("codec_type") == "audio"
+    ]
+    return bool(codecs) and all(codec == "aac" for codec in codecs)
+
+# Containers that only take mov_text subtitles
+MP4_LIKE_EXTENSIONS = {".mp4", ".m4v", ".mov"}
+
+def _merge_cmd(target_path: str, source_path: str, output_path: str, codec_args: List[str]) -> List[str]:
+    """Dual-input merge command with the given audio/subtitle codec arguments"""
+    # Input 0: Target (Video + Original Audio)
+    # Input 1: Source (Audio + Subtitles)
+    return [
+        *_base_ffmpeg_cmd(),
+        *FAST_PROBE_ARGS, "-i", target_path,
+        *FAST_PROBE_ARGS, "-i", source_path,
+        
+        # Map Video from Target
+        "-map", "0:v:0",
+        
+        # Map All Audio from Target (Keep original)
+        "-map", "0:a",
+        
+        # Map All Audio from Source
+        "-map", "1:a",
+        
+        # Map All Subtitles from Source (and Target if any)
+        "-map", "1:s?", 
+        "-map", "0:s?",
+        
+        # Codecs
+        "-c:v", "copy",       # Video copy (Fast)
+        *codec_args,
+        
+        # Metadata & Dispositions
+        "-disposition:a:0", "0",        # Target audio not default
+        "-disposition:a:1", "default",  # Source audio (new) as default
+        
+        # Fix for potentially broken timestamps
+        "-fflags", "+genpts",
+        "-avoid_negative_ts", "make_zero",
+        "-max_interleave_delta", "0",
+        
+        # Output option, so it bounds the audio encode; before an -i it would only apply to that input
+        "-threads", str(FFMPEG_THREADS),
+        
+        output_path
+    ]
+
+async def _stderr_tail(stream, max_lines: int = 64) -> str:
+    """Drain ffmpeg's stderr as it is produced, keeping only the last lines"""
+    tail = deque(maxlen=max_lines)
+    async for line in stream:
+        tail.append(line.decode(errors="replace"))
+    return "".join(tail)
+
+async def _run_ffmpeg(cmd: List[str]) -> Tuple[Optional[int], str]:
+    """
+    Run ffmpeg under FFMPEG_SEMAPHORE; the process is killed if the caller is cancelled
+    Returns (None, reason) when it runs past PROCESSING_TIMEOUT
+    """
+    process = None
+    try:
+        async with FFMPEG_SEMAPHORE:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                _, stderr = await asyncio.wait_for(
+                    asyncio.gather(process.wait(), _stderr_tail(process.stderr)),
+                    timeout=PROCESSING_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                return None, f"timed out after {PROCESSING_TIMEOUT}s"
+        return process.returncode, stderr
+    except asyncio.CancelledError:
+        # Don't leave ffmpeg running after a user cancel
+        if process is not None and process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+
+def link_or_copy(src_path: str, dst_path: str):
+    """Hardlink src to dst (free on the same filesystem), copying when linking isn't possible"""
+    try:
+        os.link(src_path, dst_path)
+    except OSError:
+        shutil.copyfile(src_path, dst_path)
+
+async def optimized_merge_v2(source_path: str, target_path: str, output_path: str) -> bool:
     """
     STABLE METHOD: 
     - No intermediate extraction to avoid sync issues.
     - Uses dual-input mapping.
     - Re-encodes only the source audio to ensure compatibility.
+    - Source audio that is already AAC is copied as-is.
+    - If the container rejects a stream, retries with all audio in AAC
+      and subtitles converted for MP4-like outputs.
+    - A source with nothing to add (no audio, no subtitles) just links the target.
+    - ffmpeg runs as an asyncio subprocess and is killed if the task is cancelled.
     """
     try:
-        print(f"--- Starting Stable Merge ---")
-        print(f"Source: {os.path.basename(source_path)}")
-        print(f"Target: {os.path.basename(target_path)}")
-        print(f"Output: {os.path.basename(output_path)}")
-        
-        # FFmpeg Command
-        # Input 0: Target (Video + Original Audio)
-        # Input 1: Source (Audio + Subtitles)
-        cmd = [
-            "ffmpeg", "-y",
-            "-i", target_path,
-            "-i", source_path,
-            
-            # Map Video from Target
-            "-map", "0:v:0",
-            
-            # Map All Audio from Target (Keep original)
-            "-map", "0:a",
-            
-            # Map All Audio from Source
-            "-map", "1:a",
-            
-            # Map All Subtitles from Source (and Target if any)
-            "-map", "1:s?", 
-            "-map", "0:s?",
-            
-            # Codecs
-            "-c:v", "copy",       # Video copy (Fast)
-            "-c:a:0", "copy",     # Target Audio copy (Original)
-            "-c:a:1", "aac",      # Source Audio re-encode (Compatibility)
-            "-b:a:1", "128k",     # Constant Bitrate for stability
-            "-c:s", "copy",       # Subtitles copy
-            
-            # Metadata & Dispositions
-            "-disposition:a:0", "0",        # Target audio not default
-            "-disposition:a:1", "default",  # Source audio (new) as default
-            
-            # Fix for potentially broken timestamps
-            "-fflags", "+genpts",
-            "-max_interleave_delta", "0",
-            
-            output_path
-        ]
-
-        process = subprocess.run(cmd, capture_output=True, text=True)
+        logger.info("--- Starting Stable Merge ---")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Source: %s", os.path.basename(source_path))
+            logger.info("Target: %s", os.path.basename(target_path))
+            logger.info("Output: %s", os.path.basename(output_path))
         
-        if process.returncode == 0:
-            print("✅ Merge Successful with Stable Method")
+        # Nothing to take from the source: the output is the target as-is
+        source_info = await asyncio.to_thread(get_media_info, source_path)
+        source_types = {stream.get("codec_type") for stream in source_info.get("streams", [])}
+        if source_info.get("format") and not source_types & {"audio", "subtitle"}:
+            logger.info("Source has no audio or subtitles, linking target as output")
+            await asyncio.to_thread(link_or_copy, target_path, output_path)
             return True
+        
+        # AAC -> AAC re-encode only loses quality and burns CPU
+        if await asyncio.to_thread(source_audio_is_aac, source_path):
+            logger.info("Source audio already AAC, copying without re-encode")
+            source_audio_codec = ["-c:a:1", "copy"]
         else:
-            print(f"❌ FFmpeg Error: {process.stderr[:500]}")
-            return False
+            source_audio_codec = ["-c:a:1", "aac", "-b:a:1", "128k"]
+        
+        subtitle_fallback = "mov_text" if get_file_extension(output_path) in MP4_LIKE_EXTENSIONS else "copy"
+        attempts = [
+            ("stable", [
+                "-c:a:0", "copy",     # Target Audio copy (Original)
+                *source_audio_codec,  # Source Audio re-encode (Compatibility) unless already AAC
+                "-c:s", "copy",       # Subtitles copy
+            ]),
+            ("compatibility", [
+                "-c:a", "aac", "-b:a", "128k",  # Every audio track to AAC
+                "-c:s", subtitle_fallback,
+            ]),
+        ]
+        
+        for name, codec_args in attempts:
+            returncode, stderr = await _run_ffmpeg(
+                _merge_cmd(target_path, source_path, output_path, codec_args)
+            )
+            if returncode == 0:
+                # One stat covers both "exists" and "not empty"
+                try:
+                    output_size = os.stat(output_path).st_size
+                except FileNotFoundError:
+                    output_size = 0
+                if output_size > 0:
+                    logger.info("✅ Merge Successful with %s method", name)
+                    return True
+                logger.error("❌ FFmpeg exited cleanly but wrote no output (%s method)", name)
+                continue
+            logger.error("❌ FFmpeg Error (%s method): %s", name, stderr)
+            if returncode is None:
+                # A hung merge won't do better with a slower re-encode
+                break
+        
+        return False
 
     except Exception as e:
-        print(f"Error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error: %s", e)
         return False
 
 def get_file_extension(file_path: str) -> str:
     """Get file extension from path"""
-    return Path(file_path).suffix.lower()
+    return os.path.splitext(file_path)[1].lower()
 
-def merge_audio_subtitles_simple(source_path: str, target_path: str, output_path: str) -> bool:
+async def merge_audio_subtitles_simple(source_path: str, target_path: str, output_path: str) -> bool:
     """
     Main merge function - Uses stable workflow
     """
-    return optimized_merge_v2(source_path, target_path, output_path)
+    return await optimized_merge_v2(source_path, target_path, output_path)
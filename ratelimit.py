@@ -0,0 +1,47 @@
+import asyncio
+import time
+from database import TTLDict
+
+
+class AsyncTokenBucket:
+    """Token bucket shared between coroutines; acquire() waits until a token is free"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+
+    async def acquire(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        # Reserve the token up front so concurrent callers queue behind each other
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+    def drain(self, seconds=0):
+        """Empty the bucket and hold the next token back for `seconds` (e.g. FloodWait)"""
+        now = time.monotonic()
+        self.tokens = min(0, self.tokens + (now - self.last) * self.rate) - seconds * self.rate
+        self.last = now
+
+
+# Bot-wide Telegram API budget shared by every user's LS / sequence run
+api_bucket = AsyncTokenBucket(rate=20.0, capacity=20)
+
+# Bot-wide cap for broadcasts (Telegram allows ~30 messages/s across different chats)
+broadcast_bucket = AsyncTokenBucket(rate=30.0, capacity=30)
+
+# Per-destination send pacing (Telegram limits messages per chat separately)
+PRIVATE_SEND_RATE = 1.25  # one copy every 0.8s
+CHANNEL_SEND_RATE = 0.5   # one copy every 2s
+_chat_buckets = TTLDict(ttl=3600)  # chat_id -> bucket; idle chats age out
+
+def chat_bucket(chat_id, rate):
+    """Send bucket for chat_id, created on first use"""
+    bucket = _chat_buckets.get(chat_id)
+    if bucket is None:
+        bucket = _chat_buckets[chat_id] = AsyncTokenBucket(rate)
+    return bucket
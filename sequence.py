@@ -1,100 +1,185 @@
 import asyncio
+import logging
 import re
 import time
+from dataclasses import dataclass
 from datetime import datetime
+from functools import lru_cache
+from operator import attrgetter
 from pyrogram import Client, filters
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+from pyrogram.enums import ChatMemberStatus, MessageMediaType
 from pyrogram.errors import UserNotParticipant, FloodWait, ChatAdminRequired, ChannelPrivate
-from config import API_HASH, API_ID, BOT_TOKEN, MONGO_URI, START_PIC, START_MSG, HELP_TXT, COMMAND_TXT, OWNER_ID, FSUB_CHANNEL, FSUB_CHANNEL_2, FSUB_CHANNEL_3
+from config import API_HASH, API_ID, BOT_TOKEN, MAX_CONCURRENT_TRANSMISSIONS, MONGO_URI, START_PIC, START_MSG, HELP_TXT, COMMAND_TXT, OWNER_ID, FSUB_CHANNEL, FSUB_CHANNEL_2, FSUB_CHANNEL_3
 
 # Import from our split modules
 from database import (
-    user_sequences, user_notification_msg, update_tasks, 
-    user_settings, processing_users, user_ls_state,
-    users_collection, update_user_stats, get_user_mode, set_user_mode
+    user_sequences, user_notification_msg, update_tasks, update_deadlines,
+    user_settings, user_locks, user_ls_state, TTLDict,
+    users_collection, update_user_stats, get_user_mode, set_user_mode, ensure_indexes
 )
+from logs import setup_logging
 from start import is_subscribed, setup_start_handlers, set_bot_start_time
+from ratelimit import api_bucket, chat_bucket, PRIVATE_SEND_RATE, CHANNEL_SEND_RATE
+
+logger = logging.getLogger(__name__)
 
 # Bot start time for uptime calculation
 BOT_START_TIME = time.time()
 
+# The one client for the whole bot; bot.py and webserver.py run this same instance
 app = Client(
     "sequence_bot", 
     api_id=API_ID, 
     api_hash=API_HASH, 
     bot_token=BOT_TOKEN,
-    workdir="/content"
+    workdir="/content",
+    # Pyrogram defaults to 1, which would run parallel_download's ranged workers one after another
+    max_concurrent_transmissions=MAX_CONCURRENT_TRANSMISSIONS
 )
 
 # --- REFINED PARSING ENGINE ---
-def parse_file_info(text):
-    """Parse file information from text (either filename or caption)"""
-    quality_match = re.search(r'(\d{3,4})[pP]', text)
-    quality = int(quality_match.group(1)) if quality_match else 0
-    clean_name = re.sub(r'\d{3,4}[pP]', '', text)
-
-    season_match = re.search(r'[sS](?:eason)?\s*(\d+)', clean_name)
-    season = int(season_match.group(1)) if season_match else 1
-    
-    ep_match = re.search(r'[eE](?:p(?:isode)?)?\s*(\d+)', clean_name)
-    if ep_match:
-        episode = int(ep_match.group(1))
-    else:
-        nums = re.findall(r'\d+', clean_name)
-        episode = int(nums[-1]) if nums else 0
+_RE_QUALITY = re.compile(r'(\d{3,4})[pP]')
+# Season, episode and bare numbers in one left-to-right pass; exactly one group per branch
+_RE_TOKENS = re.compile(
+    r'[sS](?:eason)?\s*(?P<season>\d+)'
+    r'|[eE](?:p(?:isode)?)?\s*(?P<episode>\d+)'
+    r'|(?P<num>\d+)'
+)
+
+@lru_cache(maxsize=1024)
+def _parse_file_key(text):
+    """Cached (season, episode, quality) for a filename or caption"""
+    # Strip quality tags and remember the first one in the same pass
+    qualities = []
+    def take_quality(m):
+        if not qualities:
+            qualities.append(int(m.group(1)))
+        return ''
+    clean_name = _RE_QUALITY.sub(take_quality, text)
+    quality = qualities[0] if qualities else 0
+
+    season = episode = last_num = None
+    for m in _RE_TOKENS.finditer(clean_name):
+        kind = m.lastgroup
+        value = int(m.group(kind))
+        if kind == "season":
+            if season is None:
+                season = value
+        elif kind == "episode":
+            if episode is None:
+                episode = value
+        last_num = value
+        if season is not None and episode is not None:
+            break
+
+    if season is None:
+        season = 1
+    if episode is None:
+        # fallback: last number left after removing quality
+        episode = last_num if last_num is not None else 0
+
+    return season, episode, quality
 
-    return {"season": season, "episode": episode, "quality": quality}
+@dataclass(slots=True)
+class SeqFile:
+    """One file queued for sequencing"""
+    filename: str
+    msg_id: int
+    chat_id: int
+    season: int
+    episode: int
+    quality: int
+
+    @classmethod
+    def from_text(cls, text, msg_id, chat_id):
+        """Parse season/episode/quality from text (either filename or caption)"""
+        return cls(text, msg_id, chat_id, *_parse_file_key(text))
+
+_SORT_PER_EP = attrgetter("season", "episode", "quality")
+_SORT_GROUP = attrgetter("season", "quality", "episode")
+
+def sort_key_for(mode):
+    """C-level key getter for the given sorting mode"""
+    return _SORT_PER_EP if mode == "per_ep" else _SORT_GROUP
+
+# Media types we sequence, mapped to the Message attribute holding the file
+_MEDIA_ATTR = {
+    MessageMediaType.DOCUMENT: "document",
+    MessageMediaType.VIDEO: "video",
+    MessageMediaType.AUDIO: "audio",
+}
+
+def _get_file(msg):
+    """Document, video or audio attached to msg (None-safe)"""
+    attr = _MEDIA_ATTR.get(getattr(msg, "media", None))
+    return getattr(msg, attr) if attr else None
 
 # --- UPDATED: Extract message ID from Telegram link ---
+# Anchored: optional scheme + t.me, then either c/<chat id> (private) or a username (public), then the message id
+_TME_LINK = re.compile(
+    r'(?:https?://)?t\.me/(?:c/(?P<chat>-?\d+)|(?P<user>[^/?#]+))/(?P<msg>\d+)(?:[/?#].*)?$'
+)
+
 def extract_message_info(link):
     """
     Extract chat ID and message ID from Telegram message link
     Supports formats:
     - https://t.me/c/chat_id/message_id (private channels)
     - https://t.me/username/message_id (public channels/groups)
+    The scheme is optional (t.me/username/123 works too).
     """
-    try:
-        link = link.strip()
-        
-        if "/c/" in link:
-            # Private channel link format: https://t.me/c/1234567890/123
-            parts = link.split("/")
-            
-            # Get the chat_id part (it's 1234567890 in the example)
-            chat_id_str = parts[4]
-            
-            # Check if it needs the -100 prefix
-            if chat_id_str.startswith("-100"):
-                chat_id = int(chat_id_str)
-            elif chat_id_str.startswith("100"):
-                # Some links might have 100xxxxxx format
-                chat_id = int("-" + chat_id_str)
-            else:
-                # Regular negative ID for private channels
-                chat_id = int("-100" + chat_id_str)
-            
-            message_id = int(parts[5])
-            return chat_id, message_id
-            
-        elif "t.me/" in link:
-            # Public channel/group link format: https://t.me/username/123
-            parts = link.split("/")
-            username = parts[3]
-            message_id = int(parts[4])
-            return username, message_id
-            
-    except Exception as e:
-        print(f"Error parsing link {link}: {e}")
-        import traceback
-        traceback.print_exc()
-        
-    return None, None
+    match = _TME_LINK.match(link.strip())
+    if not match:
+        return None, None
+    
+    message_id = int(match["msg"])
+    chat_id_str = match["chat"]
+    if chat_id_str is None:
+        # Public channel/group link format: https://t.me/username/123
+        return match["user"], message_id
+    
+    # Private channel link format: https://t.me/c/1234567890/123
+    # Check if it needs the -100 prefix
+    if chat_id_str.startswith("-100"):
+        chat_id = int(chat_id_str)
+    elif chat_id_str.startswith("100"):
+        # Some links might have 100xxxxxx format
+        chat_id = int("-" + chat_id_str)
+    else:
+        # Regular negative ID for private channels
+        chat_id = int("-100" + chat_id_str)
+    return chat_id, message_id
+
+# Concurrent identical requests (same chat/range) share one in-flight task
+_inflight = {}
+
+async def _coalesced(key, factory):
+    """Await the in-flight task for key, starting factory() if there is none"""
+    task = _inflight.get(key)
+    if task is None:
+        task = _inflight[key] = asyncio.ensure_future(factory())
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # shield: one waiter being cancelled must not cancel the fetch for the others
+    return await asyncio.shield(task)
 
 # --- UPDATED: Check if bot is admin in chat ---
+ADMIN_STATUSES = (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER)
+ADMIN_CACHE_TTL = 300  # seconds a positive admin check is reused
+_admin_cache = TTLDict(ttl=ADMIN_CACHE_TTL)  # chat_id or username as passed in -> monotonic time of the last positive check
+
 async def check_bot_admin(client, chat_id):
     """Check if bot is admin in the given chat/channel"""
+    checked_at = _admin_cache.get(chat_id)
+    if checked_at is not None and time.monotonic() - checked_at < ADMIN_CACHE_TTL:
+        return True
+    return await _coalesced(("admin", chat_id), lambda: _resolve_bot_admin(client, chat_id))
+
+async def _resolve_bot_admin(client, chat_id):
+    """Uncached admin check; positive results are stored in _admin_cache"""
+    cache_key = chat_id
     try:
-        print(f"Checking admin status for chat_id: {chat_id}, type: {type(chat_id)}")
+        logger.debug("Checking admin status for chat_id: %r", chat_id)
         
         # If chat_id is a username string, get the actual chat ID
         if isinstance(chat_id, str):
@@ -102,132 +187,182 @@ async def check_bot_admin(client, chat_id):
                 chat = await client.get_chat(chat_id)
                 chat_id = chat.id
             except Exception as e:
-                print(f"Error getting chat from username {chat_id}: {e}")
+                logger.warning("Error getting chat from username %s: %s", chat_id, e)
                 return False
         
-        # Try to get chat info first
-        try:
-            chat = await client.get_chat(chat_id)
-            print(f"Chat title: {chat.title}, Chat type: {chat.type}")
-        except Exception as e:
-            print(f"Error getting chat info: {e}")
-        
         # Get bot's member status
         try:
             bot_member = await client.get_chat_member(chat_id, "me")
-            print(f"Bot status: {bot_member.status}, Status type: {type(bot_member.status)}")
+            logger.debug("Bot status: %s", bot_member.status)
             
-            # Check all possible admin status strings
-            admin_statuses = [
-                "administrator", 
-                "creator",
-                "Administrator",
-                "Creator",
-                "admin",
-                "Admin",
-                "chat_member_status_administrator",
-                "chat_member_status_creator"
-            ]
+            is_admin = bot_member.status in ADMIN_STATUSES
             
-            # Also check if status is an object with attributes
-            status_str = str(bot_member.status).lower()
-            print(f"Status string: {status_str}")
-            
-            is_admin = False
-            for admin_status in admin_statuses:
-                if admin_status.lower() in status_str:
-                    is_admin = True
-                    break
-            
-            print(f"Is admin: {is_admin}")
+            logger.debug("Is admin: %s", is_admin)
+            if is_admin:
+                _admin_cache[cache_key] = time.monotonic()
+            else:
+                _admin_cache.pop(cache_key, None)
             return is_admin
             
         except (ChatAdminRequired, ChannelPrivate) as e:
-            print(f"Admin check failed (ChatAdminRequired/ChannelPrivate): {e}")
+            _admin_cache.pop(cache_key, None)
+            logger.info("Admin check failed (ChatAdminRequired/ChannelPrivate): %s", e)
             return False
         except Exception as e:
-            print(f"Admin check error: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Admin check error: %s", e)
             return False
             
     except Exception as e:
-        print(f"General error in check_bot_admin: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("General error in check_bot_admin: %s", e)
         return False
 
 # --- NEW: Get messages between two message IDs ---
-async def get_messages_between(client, chat_id, start_msg_id, end_msg_id):
-    """Fetch all messages between start_msg_id and end_msg_id (inclusive)"""
-    messages = []
-    
+GET_MESSAGES_BATCH = 200  # Max ids per get_messages call
+GET_MESSAGES_CONCURRENCY = 4  # Batches in flight at once
+
+async def _fetch_batch(client, chat_id, batch_ids, sem):
+    """One get_messages call for batch_ids; [] if it fails
+
+    replies=0: we never look at reply_to_message, and resolving it costs another RPC per batch.
+    """
+    async with sem:
+        try:
+            await api_bucket.acquire()
+            try:
+                return await client.get_messages(chat_id, batch_ids, replies=0)
+            except FloodWait as e:
+                logger.warning("FloodWait while fetching messages, sleeping %ss", e.value)
+                api_bucket.drain(e.value)
+                await api_bucket.acquire()
+                return await client.get_messages(chat_id, batch_ids, replies=0)
+        except Exception as e:
+            logger.warning("Error fetching messages %d-%d: %s", batch_ids[0], batch_ids[-1], e)
+            return []
+
+def _parse_batch(batch, current_mode):
+    """SeqFile entries for the file messages in batch, plus how many file messages it held"""
+    entries = []
+    total_files = 0
+    for msg in batch:
+        file_obj = _get_file(msg)
+        if not file_obj:
+            continue
+        total_files += 1
+        if current_mode == "caption":
+            # Caption mode: Use caption text, skip files without one
+            if not msg.caption:
+                continue
+            text_to_parse = msg.caption
+        else:
+            # File mode: Use filename
+            text_to_parse = file_obj.file_name or "Unknown"
+        
+        entries.append(SeqFile.from_text(text_to_parse, msg.id, msg.chat.id))
+    return entries, total_files
+
+async def get_messages_between(client, chat_id, start_msg_id, end_msg_id, current_mode="file"):
+    """Fetch file messages between start_msg_id and end_msg_id (inclusive) and parse them as they arrive.
+
+    Returns (files_data, total_files): the parsed entries plus the number of file messages seen,
+    which differs from len(files_data) when caption mode skips uncaptioned files.
+    """
     # Ensure start is smaller than end
     if start_msg_id > end_msg_id:
         start_msg_id, end_msg_id = end_msg_id, start_msg_id
     
+    files_data, total_files = await _coalesced(
+        ("fetch", chat_id, start_msg_id, end_msg_id, current_mode),
+        lambda: _fetch_range(client, chat_id, start_msg_id, end_msg_id, current_mode)
+    )
+    # Each caller gets its own list so sorting one can't reorder another's
+    return list(files_data), total_files
+
+async def _fetch_range(client, chat_id, start_msg_id, end_msg_id, current_mode):
+    """Uncoalesced body of get_messages_between"""
+    sem = asyncio.Semaphore(GET_MESSAGES_CONCURRENCY)
+    
+    async def fetch_and_parse(batch_start):
+        batch_ids = list(range(batch_start, min(batch_start + GET_MESSAGES_BATCH, end_msg_id + 1)))
+        # Parse each batch immediately so only the small entries outlive the Message objects
+        return _parse_batch(await _fetch_batch(client, chat_id, batch_ids, sem), current_mode)
+    
+    files_data = []
+    total_files = 0
     try:
-        # Fetch messages in batches
-        for msg_id in range(start_msg_id, end_msg_id + 1):
-            try:
-                msg = await client.get_messages(chat_id, msg_id)
-                if msg and (msg.document or msg.video or msg.audio):
-                    messages.append(msg)
-                # Small delay to avoid flood
-                await asyncio.sleep(0.1)
-            except Exception as e:
-                print(f"Error fetching message {msg_id}: {e}")
-                continue
+        # Batches fly concurrently; gather keeps them in message order
+        results = await asyncio.gather(*(
+            fetch_and_parse(batch_start)
+            for batch_start in range(start_msg_id, end_msg_id + 1, GET_MESSAGES_BATCH)
+        ))
+        for entries, count in results:
+            files_data.extend(entries)
+            total_files += count
     except Exception as e:
-        print(f"Error in get_messages_between: {e}")
+        logger.exception("Error in get_messages_between: %s", e)
     
-    return messages
+    return files_data, total_files
 
-# --- UPDATED: Sequence files from messages with mode support ---
-async def sequence_messages(client, messages, mode="per_ep", user_id=None):
-    """Convert messages to sequence format with File/Caption mode support"""
-    files_data = []
-    
-    # Get user's current mode
-    if user_id:
-        current_mode = get_user_mode(user_id)
-    else:
-        current_mode = "file"  # Default to file mode if no user_id provided
-    
-    for msg in messages:
-        file_obj = msg.document or msg.video or msg.audio
-        if file_obj:
-            if current_mode == "caption":
-                # Caption mode: Use caption text
-                if msg.caption:
-                    text_to_parse = msg.caption
-                else:
-                    # No caption found, skip this file
-                    continue
-            else:
-                # File mode: Use filename
-                file_name = file_obj.file_name if file_obj else "Unknown"
-                text_to_parse = file_name
-            
-            info = parse_file_info(text_to_parse)
-            
-            files_data.append({
-                "filename": text_to_parse,
-                "msg_id": msg.id,
-                "chat_id": msg.chat.id,
-                "info": info
-            })
-    
-    # Sort based on mode (per_ep or group)
-    if mode == "per_ep":
-        sorted_files = sorted(files_data, key=lambda x: (x["info"]["season"], x["info"]["episode"], x["info"]["quality"]))
-    else:
-        sorted_files = sorted(files_data, key=lambda x: (x["info"]["season"], x["info"]["quality"], x["info"]["episode"]))
-    
-    return sorted_files, current_mode
+# --- UPDATED: Sequence parsed files ---
+def sequence_messages(files_data, mode="per_ep"):
+    """Sort parsed file entries in place by the chosen mode (per_ep or group) and return them"""
+    files_data.sort(key=sort_key_for(mode))
+    return files_data
 
 # ----------------------- NEW: /sf COMMAND -----------------------
 
+# Static keyboards, built once; only the checkmark differs between modes
+MODE_BUTTONS = {
+    "file": InlineKeyboardMarkup([
+        [InlineKeyboardButton("✅ File mode", callback_data="mode_file")],
+        [InlineKeyboardButton("Caption mode", callback_data="mode_caption")],
+        [InlineKeyboardButton("Close", callback_data="close_mode")]
+    ]),
+    "caption": InlineKeyboardMarkup([
+        [InlineKeyboardButton("File mode", callback_data="mode_file")],
+        [InlineKeyboardButton("✅ Caption mode", callback_data="mode_caption")],
+        [InlineKeyboardButton("Close", callback_data="close_mode")]
+    ]),
+}
+
+FILESEQ_BUTTONS = InlineKeyboardMarkup([
+    [InlineKeyboardButton("ᴇᴘɪsᴏᴅᴇ ꜰʟᴏᴡ", callback_data='set_mode_per_ep')],
+    [InlineKeyboardButton("ǫᴜᴀʟɪᴛʏ ꜰʟᴏᴡ", callback_data='set_mode_group')]
+])
+
+# Mode-dependent prompts, pre-formatted for both modes
+MODE_SETTINGS_TEXT = {
+    mode: f"""<b>🔄 Sequence Mode Settings</b>
+
+<blockquote><b>Current Mode:</b> {label}
+
+<b>File mode:</b> Sequence files using filename
+<b>Caption mode:</b> Sequence files using file caption
+
+ℹ️ <i>If no caption is found in Caption mode, those files will be skipped.</i></blockquote>"""
+    for mode, label in (("file", "File mode"), ("caption", "Caption mode"))
+}
+
+LS_START_TEXT = {
+    mode: (
+        f"<blockquote><b>📁 LS MODE ACTIVATED</b></blockquote>\n\n"
+        f"<blockquote>Current mode: <b>{label}</b></blockquote>\n"
+        f"<blockquote>Please send the first file link from the channel/group.</blockquote>\n"
+        f"<blockquote>ℹ️ Note: For private channels, the bot must be an admin.</blockquote>"
+    )
+    for mode, label in (("file", "File mode"), ("caption", "Caption mode"))
+}
+
+SEQUENCE_START_TEXT = {
+    mode: (
+        f"<blockquote><b>ғɪʟᴇ sᴇǫᴜᴇɴᴄᴇ ᴍᴏᴅᴇ sᴛᴀʀᴛᴇᴅ!</b></blockquote>\n"
+        f"<blockquote>Current mode: {label}</blockquote>\n"
+        f"<blockquote>Send your files now</blockquote>"
+    )
+    for mode, label in (("file", "File mode (using filename)"), ("caption", "Caption mode (using file caption)"))
+}
+
+SEQUENCE_BUTTONS = InlineKeyboardMarkup([[InlineKeyboardButton("Send", callback_data='send_sequence'), InlineKeyboardButton("Cancel", callback_data='cancel_sequence')]])
+
 @app.on_message(filters.command("sf"))
 async def switch_mode_cmd(client, message):
     """Handle /sf command to switch between File mode and Caption mode"""
@@ -237,30 +372,8 @@ async def switch_mode_cmd(client, message):
     user_id = message.from_user.id
     current_mode = get_user_mode(user_id)
     
-    # Create buttons based on current mode
-    if current_mode == "file":
-        buttons = InlineKeyboardMarkup([
-            [InlineKeyboardButton("✅ File mode", callback_data="mode_file")],
-            [InlineKeyboardButton("Caption mode", callback_data="mode_caption")],
-            [InlineKeyboardButton("Close", callback_data="close_mode")]
-        ])
-    else:
-        buttons = InlineKeyboardMarkup([
-            [InlineKeyboardButton("File mode", callback_data="mode_file")],
-            [InlineKeyboardButton("✅ Caption mode", callback_data="mode_caption")],
-            [InlineKeyboardButton("Close", callback_data="close_mode")]
-        ])
-    
-    text = f"""<b>🔄 Sequence Mode Settings</b>
-
-<blockquote><b>Current Mode:</b> {'File mode' if current_mode == 'file' else 'Caption mode'}
-
-<b>File mode:</b> Sequence files using filename
-<b>Caption mode:</b> Sequence files using file caption
-
-ℹ️ <i>If no caption is found in Caption mode, those files will be skipped.</i></blockquote>"""
-    
-    await message.reply_text(text, reply_markup=buttons)
+    key = "file" if current_mode == "file" else "caption"
+    await message.reply_text(MODE_SETTINGS_TEXT[key], reply_markup=MODE_BUTTONS[key])
 
 # ----------------------- MODE CALLBACK HANDLER -----------------------
 
@@ -272,11 +385,7 @@ async def mode_callback_handler(client, query):
     
     if data == "mode_file":
         set_user_mode(user_id, "file")
-        buttons = InlineKeyboardMarkup([
-            [InlineKeyboardButton("✅ File mode", callback_data="mode_file")],
-            [InlineKeyboardButton("Caption mode", callback_data="mode_caption")],
-            [InlineKeyboardButton("Close", callback_data="close_mode")]
-        ])
+        buttons = MODE_BUTTONS["file"]
         text = """<b>🔄 Sequence Mode Settings</b>
 
 <blockquote><b>Current Mode:</b> File mode
@@ -291,11 +400,7 @@ async def mode_callback_handler(client, query):
         
     elif data == "mode_caption":
         set_user_mode(user_id, "caption")
-        buttons = InlineKeyboardMarkup([
-            [InlineKeyboardButton("File mode", callback_data="mode_file")],
-            [InlineKeyboardButton("✅ Caption mode", callback_data="mode_caption")],
-            [InlineKeyboardButton("Close", callback_data="close_mode")]
-        ])
+        buttons = MODE_BUTTONS["caption"]
         text = """<b>🔄 Sequence Mode Settings</b>
 
 <blockquote><b>Current Mode:</b> Caption mode
@@ -336,11 +441,7 @@ async def quality_mode_cmd(client, message):
     "sᴇᴀsᴏɴ 1 → ᴀʟʟ 720ᴘ</blockquote>"
     )
     
-    buttons = InlineKeyboardMarkup([
-        [InlineKeyboardButton("ᴇᴘɪsᴏᴅᴇ ꜰʟᴏᴡ", callback_data='set_mode_per_ep')],
-        [InlineKeyboardButton("ǫᴜᴀʟɪᴛʏ ꜰʟᴏᴡ", callback_data='set_mode_group')]
-    ])
-    await message.reply_text(text, reply_markup=buttons)
+    await message.reply_text(text, reply_markup=FILESEQ_BUTTONS)
 
 # ----------------------- UPDATED: /ls COMMAND -----------------------
 
@@ -354,7 +455,6 @@ async def ls_command(client, message):
     
     # Get user's current mode
     current_mode = get_user_mode(user_id)
-    mode_text = "File mode" if current_mode == "file" else "Caption mode"
     
     # Initialize LS state for user WITH mode information
     user_ls_state[user_id] = {
@@ -366,152 +466,230 @@ async def ls_command(client, message):
         "current_mode": current_mode  # Store user's File/Caption mode
     }
     
+    await message.reply_text(LS_START_TEXT["file" if current_mode == "file" else "caption"])
+
+# --- Handle Telegram links for LS mode ---
+def _in_ls(_, __, message):
+    """Only users with an open /ls session whose message starts with a t.me link"""
+    return (
+        message.from_user is not None
+        and message.from_user.id in user_ls_state
+        and message.text.lstrip().startswith(("https://t.me/", "http://t.me/", "t.me/"))
+    )
+
+async def _ls_first_link(client, message, user_id, ls_data, link):
+    """Step 1: remember where the range starts"""
+    chat_info, msg_id = extract_message_info(link)
+    
+    logger.debug("Extracted first link - Chat info: %s, Msg ID: %s", chat_info, msg_id)
+    
+    if not msg_id:
+        await message.reply_text("<blockquote>❌ Invalid link format. Please send a valid Telegram message link.</blockquote>")
+        return
+    
+    # Store first link data
+    ls_data.update({
+        "first_link": link,
+        "first_chat": chat_info,
+        "first_msg_id": msg_id,
+        "step": 2
+    })
+    
+    current_mode = ls_data.get("current_mode", "file")
+    mode_text = "File mode" if current_mode == "file" else "Caption mode"
+    
     await message.reply_text(
-        f"<blockquote><b>📁 LS MODE ACTIVATED</b></blockquote>\n\n"
+        f"<blockquote><b>✅ First link received!</b></blockquote>\n\n"
         f"<blockquote>Current mode: <b>{mode_text}</b></blockquote>\n"
-        f"<blockquote>Please send the first file link from the channel/group.</blockquote>\n"
-        f"<blockquote>ℹ️ Note: For private channels, the bot must be an admin.</blockquote>"
+        f"<blockquote>Now please send the second file link from the same channel/group.</blockquote>"
     )
 
-# --- Handle Telegram links for LS mode ---
-@app.on_message(filters.text & filters.regex(r'https?://t\.me/'))
+async def _ls_second_link(client, message, user_id, ls_data, link):
+    """Step 2: validate the end of the range and offer Chat/Channel"""
+    second_chat, second_msg_id = extract_message_info(link)
+    
+    logger.debug("Extracted second link - Chat info: %s, Msg ID: %s", second_chat, second_msg_id)
+    
+    if not second_msg_id:
+        await message.reply_text("<blockquote>❌ Invalid link format. Please send a valid Telegram message link.</blockquote>")
+        return
+    
+    # Check if both links are from same chat
+    logger.debug("Comparing: First chat: %r, Second chat: %r", ls_data['first_chat'], second_chat)
+    
+    # Convert both to same type for comparison
+    first_chat = ls_data["first_chat"]
+    if isinstance(first_chat, int) and isinstance(second_chat, str):
+        # Try to resolve the string to ID for comparison
+        try:
+            chat_obj = await client.get_chat(second_chat)
+            second_chat = chat_obj.id
+        except:
+            pass
+    elif isinstance(first_chat, str) and isinstance(second_chat, int):
+        # Try to resolve the int to username for comparison
+        try:
+            chat_obj = await client.get_chat(second_chat)
+            if chat_obj.username:
+                second_chat = chat_obj.username
+        except:
+            pass
+    
+    if first_chat != second_chat:
+        await message.reply_text("<blockquote>❌ Both links must be from the same channel/group.</blockquote>")
+        # Reset LS state
+        del user_ls_state[user_id]
+        return
+    
+    # Store second link data
+    ls_data.update({
+        "second_link": link,
+        "second_chat": second_chat,
+        "second_msg_id": second_msg_id
+    })
+    
+    current_mode = ls_data.get("current_mode", "file")
+    mode_text = "File mode" if current_mode == "file" else "Caption mode"
+    
+    # Show buttons for Chat/Channel choice
+    buttons = InlineKeyboardMarkup([
+        [InlineKeyboardButton("💬 Chat", callback_data=f"ls_chat_{user_id}")],
+        [InlineKeyboardButton("📢 Channel", callback_data=f"ls_channel_{user_id}")],
+        [InlineKeyboardButton("❌ Close", callback_data=f"ls_close_{user_id}")]
+    ])
+    
+    await message.reply_text(
+        f"<blockquote><b>✅ Both links received!</b></blockquote>\n\n"
+        f"<blockquote>Current mode: <b>{mode_text}</b></blockquote>\n"
+        f"<blockquote>Choose where to send sequenced files:</blockquote>",
+        reply_markup=buttons
+    )
+
+LS_STEP_HANDLERS = {1: _ls_first_link, 2: _ls_second_link}
+
+@app.on_message(filters.text & filters.create(_in_ls))
 async def handle_ls_links(client, message):
     """Handle Telegram links for LS mode"""
     user_id = message.from_user.id
     
-    if user_id not in user_ls_state:
-        return  # Not in LS mode
-    
-    ls_data = user_ls_state[user_id]
+    ls_data = user_ls_state.get(user_id)
+    if ls_data is None:
+        return  # Session expired after the filter ran
     link = message.text.strip()
     
-    print(f"Received LS link: {link}, Step: {ls_data['step']}, Mode: {ls_data.get('current_mode', 'file')}")
+    logger.debug("Received LS link: %s, Step: %s, Mode: %s", link, ls_data['step'], ls_data.get('current_mode', 'file'))
     
     try:
-        if ls_data["step"] == 1:
-            # First link
-            chat_info, msg_id = extract_message_info(link)
-            
-            print(f"Extracted first link - Chat info: {chat_info}, Msg ID: {msg_id}")
-            
-            if not msg_id:
-                await message.reply_text("<blockquote>❌ Invalid link format. Please send a valid Telegram message link.</blockquote>")
-                return
-            
-            # Store first link data
-            user_ls_state[user_id].update({
-                "first_link": link,
-                "first_chat": chat_info,
-                "first_msg_id": msg_id,
-                "step": 2
-            })
-            
-            current_mode = ls_data.get("current_mode", "file")
-            mode_text = "File mode" if current_mode == "file" else "Caption mode"
-            
-            await message.reply_text(
-                f"<blockquote><b>✅ First link received!</b></blockquote>\n\n"
-                f"<blockquote>Current mode: <b>{mode_text}</b></blockquote>\n"
-                f"<blockquote>Now please send the second file link from the same channel/group.</blockquote>"
-            )
-            
-        elif ls_data["step"] == 2:
-            # Second link
-            second_chat, second_msg_id = extract_message_info(link)
-            
-            print(f"Extracted second link - Chat info: {second_chat}, Msg ID: {second_msg_id}")
-            
-            if not second_msg_id:
-                await message.reply_text("<blockquote>❌ Invalid link format. Please send a valid Telegram message link.</blockquote>")
-                return
-            
-            # Check if both links are from same chat
-            print(f"Comparing: First chat: {ls_data['first_chat']} (type: {type(ls_data['first_chat'])}), "
-                  f"Second chat: {second_chat} (type: {type(second_chat)})")
-            
-            # Convert both to same type for comparison
-            first_chat = ls_data["first_chat"]
-            if isinstance(first_chat, int) and isinstance(second_chat, str):
-                # Try to resolve the string to ID for comparison
-                try:
-                    chat_obj = await client.get_chat(second_chat)
-                    second_chat = chat_obj.id
-                except:
-                    pass
-            elif isinstance(first_chat, str) and isinstance(second_chat, int):
-                # Try to resolve the int to username for comparison
-                try:
-                    chat_obj = await client.get_chat(second_chat)
-                    if chat_obj.username:
-                        second_chat = chat_obj.username
-                except:
-                    pass
-            
-            if first_chat != second_chat:
-                await message.reply_text("<blockquote>❌ Both links must be from the same channel/group.</blockquote>")
-                # Reset LS state
-                del user_ls_state[user_id]
-                return
-            
-            # Store second link data
-            user_ls_state[user_id].update({
-                "second_link": link,
-                "second_chat": second_chat,
-                "second_msg_id": second_msg_id
-            })
-            
-            current_mode = ls_data.get("current_mode", "file")
-            mode_text = "File mode" if current_mode == "file" else "Caption mode"
-            
-            # Show buttons for Chat/Channel choice
-            buttons = InlineKeyboardMarkup([
-                [InlineKeyboardButton("💬 Chat", callback_data=f"ls_chat_{user_id}")],
-                [InlineKeyboardButton("📢 Channel", callback_data=f"ls_channel_{user_id}")],
-                [InlineKeyboardButton("❌ Close", callback_data=f"ls_close_{user_id}")]
-            ])
-            
-            await message.reply_text(
-                f"<blockquote><b>✅ Both links received!</b></blockquote>\n\n"
-                f"<blockquote>Current mode: <b>{mode_text}</b></blockquote>\n"
-                f"<blockquote>Choose where to send sequenced files:</blockquote>",
-                reply_markup=buttons
-            )
+        step_handler = LS_STEP_HANDLERS.get(ls_data["step"])
+        if step_handler is not None:
+            await step_handler(client, message, user_id, ls_data, link)
             
     except Exception as e:
-        print(f"Error handling LS link: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error handling LS link: %s", e)
         await message.reply_text("<blockquote>❌ An error occurred. Please try again with valid links.</blockquote>")
         if user_id in user_ls_state:
             del user_ls_state[user_id]
 
 # ----------------------- SORTING ENGINE -----------------------
 
+COPY_FLOODWAIT_RETRIES = 3
+
+async def copy_with_retry(client, chat_id, file, send_bucket):
+    """copy_message paced by send_bucket; on FloodWait, wait it out and retry the same file.
+
+    Returns False if FloodWait persisted through every retry; other errors propagate.
+    """
+    for _ in range(COPY_FLOODWAIT_RETRIES + 1):
+        await send_bucket.acquire()
+        await api_bucket.acquire()
+        try:
+            await client.copy_message(chat_id, from_chat_id=file.chat_id, message_id=file.msg_id)
+            return True
+        except FloodWait as e:
+            # Telegram explicitly told us to wait. We must comply; the next acquire() waits it out.
+            logger.warning("FloodWait triggered. Sleeping for %s seconds as requested by Telegram.", e.value)
+            send_bucket.drain(e.value)
+    return False
+
+FORWARD_BATCH = 100  # Max ids per forward_messages call
+
+async def _forward_batch(client, chat_id, from_chat_id, batch, send_bucket):
+    """Forward batch with drop_author in one call; copy file by file if forwarding isn't allowed"""
+    message_ids = [file.msg_id for file in batch]
+    for _ in range(COPY_FLOODWAIT_RETRIES + 1):
+        await send_bucket.acquire()
+        await api_bucket.acquire()
+        try:
+            forwarded = await client.forward_messages(chat_id, from_chat_id, message_ids, drop_author=True)
+            return len(forwarded)
+        except FloodWait as e:
+            logger.warning("FloodWait triggered. Sleeping for %s seconds as requested by Telegram.", e.value)
+            send_bucket.drain(e.value)
+        except Exception as e:
+            # e.g. CHAT_FORWARDS_RESTRICTED on the source chat
+            logger.warning("Forwarding %d files failed (%s); copying them one by one", len(batch), e)
+            break
+    else:
+        return 0
+    
+    sent = 0
+    for file in batch:
+        try:
+            if await copy_with_retry(client, chat_id, file, send_bucket):
+                sent += 1
+        except Exception as e:
+            logger.warning("Non-FloodWait error sending file to channel: %s", e)
+    return sent
+
+def _ascending_runs(files):
+    """Split files into runs from one source chat with increasing msg_id, at most FORWARD_BATCH long"""
+    run = []
+    for file in files:
+        if run and (file.chat_id != run[-1].chat_id or file.msg_id <= run[-1].msg_id
+                    or len(run) >= FORWARD_BATCH):
+            yield run
+            run = []
+        run.append(file)
+    if run:
+        yield run
+
+async def forward_in_batches(client, chat_id, files, send_bucket):
+    """Send files to chat_id in order, batching where it can't reorder them; returns how many arrived"""
+    sent = 0
+    # Telegram delivers a forward_messages batch in ascending message id order, whatever order
+    # the ids are passed in; so only runs that are already ascending share a call
+    for run in _ascending_runs(files):
+        if len(run) == 1:
+            try:
+                if await copy_with_retry(client, chat_id, run[0], send_bucket):
+                    sent += 1
+            except Exception as e:
+                logger.warning("Non-FloodWait error sending file to channel: %s", e)
+        else:
+            sent += await _forward_batch(client, chat_id, run[0].chat_id, run, send_bucket)
+    return sent
+
 async def send_sequence_files(client, message, user_id):
     if user_id not in user_sequences or not user_sequences[user_id]:
         await message.edit_text("<blockquote>Nᴏ ғɪʟᴇs ɪɴ sᴇǫᴜᴇɴᴄᴇ!</blockquote>")
         return
 
-    files_data = user_sequences[user_id]
+    # Take the list out of the session so it can be sorted in place without files arriving mid-send
+    files_data = user_sequences.pop(user_id)
     mode = user_settings.get(user_id, "per_ep")
     await message.edit_text("<blockquote>📤 sᴇɴᴅɪɴɢ ғɪʟᴇs... ᴘʟᴇᴀsᴇ ᴡᴀɪᴛ.</blockquote>")
 
-    if mode == "per_ep":
-        sorted_files = sorted(files_data, key=lambda x: (x["info"]["season"], x["info"]["episode"], x["info"]["quality"]))
-    else:
-        sorted_files = sorted(files_data, key=lambda x: (x["info"]["season"], x["info"]["quality"], x["info"]["episode"]))
+    sorted_files = sequence_messages(files_data, mode)
 
+    send_bucket = chat_bucket(message.chat.id, PRIVATE_SEND_RATE)
     for file in sorted_files:
-        try:
-            await client.copy_message(message.chat.id, from_chat_id=file["chat_id"], message_id=file["msg_id"])
-            await asyncio.sleep(0.8) 
+        try: await copy_with_retry(client, message.chat.id, file, send_bucket)
         except: continue
 
     update_user_stats(user_id, len(files_data), message.from_user.first_name)
     
     try: await message.delete()
     except: pass
-    user_sequences.pop(user_id, None)
     user_notification_msg.pop(user_id, None)
     await client.send_message(message.chat.id, "<blockquote><b>✅ ᴀʟʟ ғɪʟᴇs sᴇǫᴜᴇɴᴄᴇᴅ ꜱᴜᴄᴄᴇꜱꜰᴜʟʟʏ!</b></blockquote>")
 
@@ -527,13 +705,7 @@ async def start_sequence(client, message):
     
     # Get current mode
     current_mode = get_user_mode(user_id)
-    mode_text = "File mode (using filename)" if current_mode == "file" else "Caption mode (using file caption)"
-    
-    await message.reply_text(
-        f"<blockquote><b>ғɪʟᴇ sᴇǫᴜᴇɴᴄᴇ ᴍᴏᴅᴇ sᴛᴀʀᴛᴇᴅ!</b></blockquote>\n"
-        f"<blockquote>Current mode: {mode_text}</blockquote>\n"
-        f"<blockquote>Send your files now</blockquote>"
-    )
+    await message.reply_text(SEQUENCE_START_TEXT["file" if current_mode == "file" else "caption"])
 
 # 🔥 MODIFIED FUNCTION: store_file - UPDATED WITH FIX AND MODE SUPPORT
 @app.on_message(filters.document | filters.video | filters.audio)
@@ -545,7 +717,7 @@ async def store_file(client, message):
     
     # Check if we are currently in a sequence session
     if user_id in user_sequences:
-        file_obj = message.document or message.video or message.audio
+        file_obj = _get_file(message)
         current_mode = get_user_mode(user_id)
         
         if current_mode == "caption":
@@ -564,43 +736,46 @@ async def store_file(client, message):
             file_name = file_obj.file_name if file_obj else "Unknown"
             text_to_parse = file_name
         
-        info = parse_file_info(text_to_parse)
-        
-        user_sequences[user_id].append({
-            "filename": text_to_parse,
-            "msg_id": message.id,
-            "chat_id": message.chat.id,
-            "info": info
-        })
+        user_sequences[user_id].append(SeqFile.from_text(text_to_parse, message.id, message.chat.id))
         # Get current count
         current_count = len(user_sequences[user_id])
 
         # 🔥 Send "Processing" ONLY if 20+ files are added
-        if user_id not in user_notification_msg and user_id not in processing_users and current_count >= 20:
-            processing_users.add(user_id) # Lock the user
-            try:
-                msg = await client.send_message(
-                    message.chat.id,
-                    "<blockquote>⏳ Processing files… please wait</blockquote>"
-                )
-                user_notification_msg[user_id] = {
-                    "msg_id": msg.id,
-                    "chat_id": message.chat.id
-                }
-            finally:
-                processing_users.remove(user_id) # Release the lock
+        if current_count >= 20 and user_id not in user_notification_msg:
+            async with user_locks.setdefault(user_id, asyncio.Lock()):
+                # Re-check: another file may have sent it while we waited for the lock
+                if user_id not in user_notification_msg:
+                    msg = await client.send_message(
+                        message.chat.id,
+                        "<blockquote>⏳ Processing files… please wait</blockquote>"
+                    )
+                    user_notification_msg[user_id] = {
+                        "msg_id": msg.id,
+                        "chat_id": message.chat.id
+                    }
         
-        # Cancel previous update task and start a new one (Debouncing)
-        if user_id in update_tasks: 
-            update_tasks[user_id].cancel()
-        update_tasks[user_id] = asyncio.create_task(update_notification(client, user_id, message.chat.id))
+        # Push the deadline back; a single worker per user waits for the burst to settle (Debouncing)
+        update_deadlines[user_id] = asyncio.get_running_loop().time() + NOTIFY_DEBOUNCE
+        task = update_tasks.get(user_id)
+        if task is None or task.done():
+            update_tasks[user_id] = asyncio.create_task(update_notification(client, user_id, message.chat.id))
 
 # 🔥 MODIFIED FUNCTION: update_notification
+NOTIFY_DEBOUNCE = 3.0
+
 async def update_notification(client, user_id, chat_id):
-    await asyncio.sleep(3) 
+    loop = asyncio.get_running_loop()
+    while True:
+        remaining = update_deadlines.get(user_id, 0) - loop.time()
+        if remaining <= 0:
+            break
+        await asyncio.sleep(remaining)
+    # Release the slot before any await so a file arriving during the edit starts a new worker
+    update_deadlines.pop(user_id, None)
+    update_tasks.pop(user_id, None)
     if user_id not in user_sequences: return
     count = len(user_sequences[user_id])
-    buttons = InlineKeyboardMarkup([[InlineKeyboardButton("Send", callback_data='send_sequence'), InlineKeyboardButton("Cancel", callback_data='cancel_sequence')]])
+    buttons = SEQUENCE_BUTTONS
     text = f"<blockquote>ғɪʟᴇs ᴀᴅᴅᴇᴅ! ᴄʟɪᴄᴋ ʙᴜᴛᴛᴏɴs ʙᴇʟᴏᴡ:</blockquote>\n<blockquote>ᴛᴏᴛᴀʟ ғɪʟᴇs: {count}</blockquote>"
     if user_id in user_notification_msg:
         try: await client.edit_message_text(chat_id=user_notification_msg[user_id]["chat_id"], message_id=user_notification_msg[user_id]["msg_id"], text=text, reply_markup=buttons)
@@ -647,15 +822,15 @@ async def ls_callback_handlers(client, query):
             start_msg_id = ls_data["first_msg_id"]
             end_msg_id = ls_data["second_msg_id"]
             
-            # Fetch messages
-            messages = await get_messages_between(client, chat_id, start_msg_id, end_msg_id)
+            # Fetch and parse messages WITH user mode
+            used_mode = get_user_mode(target_user_id)
+            files_data, total_files = await get_messages_between(client, chat_id, start_msg_id, end_msg_id, used_mode)
             
-            if not messages:
+            if not total_files:
                 await query.message.edit_text("<blockquote>❌ No files found between the specified links.</blockquote>")
                 return
             
-            # Process and sequence files WITH user mode
-            sorted_files, used_mode = await sequence_messages(client, messages, ls_data["mode"], target_user_id)
+            sorted_files = sequence_messages(files_data, ls_data["mode"])
             
             if not sorted_files:
                 if used_mode == "caption":
@@ -668,7 +843,7 @@ async def ls_callback_handlers(client, query):
                 return
             
             mode_text = "File mode" if used_mode == "file" else "Caption mode"
-            skipped_count = len(messages) - len(sorted_files) if used_mode == "caption" else 0
+            skipped_count = total_files - len(sorted_files) if used_mode == "caption" else 0
             
             # Send files to user's chat
             if skipped_count > 0:
@@ -678,12 +853,12 @@ async def ls_callback_handlers(client, query):
             else:
                 await query.message.edit_text(f"<blockquote>📤 Sending {len(sorted_files)} files to chat... Please wait.</blockquote>")
             
+            send_bucket = chat_bucket(user_id, PRIVATE_SEND_RATE)
             for file in sorted_files:
                 try:
-                    await client.copy_message(user_id, from_chat_id=file["chat_id"], message_id=file["msg_id"])
-                    await asyncio.sleep(0.8)
+                    await copy_with_retry(client, user_id, file, send_bucket)
                 except Exception as e:
-                    print(f"Error sending file: {e}")
+                    logger.warning("Error sending file: %s", e)
                     continue
             
             # Update user stats
@@ -702,7 +877,7 @@ async def ls_callback_handlers(client, query):
                 )
             
         except Exception as e:
-            print(f"LS Chat error: {e}")
+            logger.exception("LS Chat error: %s", e)
             await query.message.edit_text("<blockquote>❌ An error occurred while processing files. Please try again.</blockquote>")
         
         # Clean up
@@ -710,24 +885,22 @@ async def ls_callback_handlers(client, query):
             del user_ls_state[target_user_id]
     
     elif action == "channel":
-        await query.message.edit_text("<blockquote>⏳ Checking bot permissions in channel... Please wait.</blockquote>")
+        # One progress edit until sending starts; each edit is a round trip
+        await query.message.edit_text("<blockquote>⏳ Checking bot permissions and fetching files from channel... Please wait.</blockquote>")
         
         try:
             # Check if bot is admin in the channel
             chat_id = ls_data["first_chat"]
-            
-            # First, let's try to get chat info
-            try:
-                chat = await client.get_chat(chat_id)
-                await query.message.edit_text(f"<blockquote>Checking channel: {chat.title} ({chat_id})</blockquote>")
-            except Exception as e:
-                await query.message.edit_text(f"<blockquote>Error getting channel info: {e}</blockquote>")
-                return
-            
-            # Now check admin status
             is_admin = await check_bot_admin(client, chat_id)
             
             if not is_admin:
+                # Chat info is only needed to explain the failure
+                try:
+                    chat = await client.get_chat(chat_id)
+                except Exception as e:
+                    await query.message.edit_text(f"<blockquote>Error getting channel info: {e}</blockquote>")
+                    return
+                
                 # Get more detailed info about the bot's status
                 try:
                     bot_member = await client.get_chat_member(chat_id, "me")
@@ -750,21 +923,19 @@ async def ls_callback_handlers(client, query):
                     )
                 return
             
-            await query.message.edit_text("<blockquote>✅ Bot is admin! Fetching files from channel... Please wait.</blockquote>")
-            
             # Get messages between the two links
             start_msg_id = ls_data["first_msg_id"]
             end_msg_id = ls_data["second_msg_id"]
             
-            # Fetch messages
-            messages = await get_messages_between(client, chat_id, start_msg_id, end_msg_id)
+            # Fetch and parse messages WITH user mode
+            used_mode = get_user_mode(target_user_id)
+            files_data, total_files = await get_messages_between(client, chat_id, start_msg_id, end_msg_id, used_mode)
             
-            if not messages:
+            if not total_files:
                 await query.message.edit_text("<blockquote>❌ No files found between the specified links.</blockquote>")
                 return
             
-            # Process and sequence files WITH user mode
-            sorted_files, used_mode = await sequence_messages(client, messages, ls_data["mode"], target_user_id)
+            sorted_files = sequence_messages(files_data, ls_data["mode"])
             
             if not sorted_files:
                 if used_mode == "caption":
@@ -777,7 +948,7 @@ async def ls_callback_handlers(client, query):
                 return
             
             mode_text = "File mode" if used_mode == "file" else "Caption mode"
-            skipped_count = len(messages) - len(sorted_files) if used_mode == "caption" else 0
+            skipped_count = total_files - len(sorted_files) if used_mode == "caption" else 0
             
             # Send files back to channel
             if skipped_count > 0:
@@ -787,24 +958,9 @@ async def ls_callback_handlers(client, query):
             else:
                 await query.message.edit_text(f"<blockquote>📤 Sending {len(sorted_files)} files to channel... Please wait.</blockquote>")
             
-            success_count = 0
-            for file in sorted_files:
-                try:
-                    await client.copy_message(chat_id, from_chat_id=file["chat_id"], message_id=file["msg_id"])
-                    
-                    # --- FIX FOR FloodWait Error: Increased delay and FloodWait handling ---
-                    await asyncio.sleep(2)  # Wait 2 seconds between sending files
-                    
-                except FloodWait as e:
-                    # Telegram explicitly told us to wait. We must comply.
-                    print(f"FloodWait triggered. Sleeping for {e.value} seconds as requested by Telegram.")
-                    await asyncio.sleep(e.value)  # Wait for the exact required time
-                    
-                except Exception as e:
-                    print(f"Non-FloodWait error sending file to channel: {e}")
-                    continue
-                else:
-                    success_count += 1
+            # --- FIX FOR FloodWait Error: channel sends paced at one call every 2 seconds ---
+            send_bucket = chat_bucket(chat_id, CHANNEL_SEND_RATE)
+            success_count = await forward_in_batches(client, chat_id, sorted_files, send_bucket)
             
             # Update user stats
             update_user_stats(user_id, success_count, query.from_user.first_name)
@@ -813,7 +969,7 @@ async def ls_callback_handlers(client, query):
                 await query.message.edit_text(
                     f"<blockquote><b>✅ Successfully sent {success_count} files back to the channel!</b></blockquote>\n"
                     f"<blockquote>Mode: {mode_text}</blockquote>\n"
-                    f"<blockquote>Total files found: {len(messages)}\n"
+                    f"<blockquote>Total files found: {total_files}\n"
                     f"Files with captions: {len(sorted_files)}\n"
                     f"Successfully sent: {success_count}\n"
                     f"Skipped (no captions): {skipped_count}</blockquote>"
@@ -827,9 +983,7 @@ async def ls_callback_handlers(client, query):
                 )
             
         except Exception as e:
-            print(f"LS Channel error: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("LS Channel error: %s", e)
             await query.message.edit_text(f"<blockquote>❌ An error occurred: {str(e)[:200]}...</blockquote>")
         
         # Clean up
@@ -876,11 +1030,16 @@ async def sequence_control_callback(client, query):
 # ----------------------- MAIN ENTRY POINT -----------------------
 def main():
     """Initialize and run the bot"""
+    setup_logging()
+    ensure_indexes()
+    
     # Set bot start time
     set_bot_start_time()
     
-    # Setup start handlers
+    # Setup start and merging handlers
     setup_start_handlers(app)
+    from handler_merging import setup_merging_handlers
+    setup_merging_handlers(app)
     
     # Run the bot
     app.run()
@@ -1,12 +1,20 @@
 import asyncio
+import logging
 import time
 from pyrogram import Client, filters
+from pyrogram.enums import ChatMemberStatus
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-from pyrogram.errors import UserNotParticipant, FloodWait, ChatAdminRequired, ChannelPrivate
+from pyrogram.errors import (
+    UserNotParticipant, FloodWait, ChatAdminRequired, ChannelPrivate, RPCError,
+    UserIsBlocked, UserDeactivated, InputUserDeactivated, PeerIdInvalid
+)
 from config import START_PIC, START_MSG, HELP_TXT, COMMAND_TXT, OWNER_ID, FSUB_CHANNEL, FSUB_CHANNEL_2, FSUB_CHANNEL_3
 
 # Import database functions
-from database import users_collection, save_broadcast_stats
+from database import users_collection, save_broadcast_stats, TTLDict
+from ratelimit import broadcast_bucket
+
+logger = logging.getLogger(__name__)
 
 # Bot start time for uptime calculation
 BOT_START_TIME = None
@@ -19,58 +27,144 @@ def set_bot_start_time():
 
 
 # --- UPDATED MULTI-CHANNEL FORCE SUBSCRIBE CHECKER ---
+# Configured channels with zero/empty ids filtered out, resolved once at import
+FSUB_CHANNELS = tuple(c for c in (FSUB_CHANNEL, FSUB_CHANNEL_2, FSUB_CHANNEL_3) if c)
+
+SUB_CACHE_TTL = 60  # seconds a passed check is trusted before asking Telegram again
+_sub_cache = TTLDict(ttl=SUB_CACHE_TTL)  # user_id -> monotonic expiry of the last passed check
+
+FSUB_MEMBER_TTL = 300  # seconds a per-channel membership status is reused
+_member_cache = TTLDict(ttl=FSUB_MEMBER_TTL)  # (channel_id, user_id) -> (monotonic time, status)
+_channel_info_cache = {}  # channel_id -> (title, url); kept warm by _refresh_fsub_meta
+FSUB_META_REFRESH = 6 * 3600  # seconds between background refreshes of channel titles/invite links
+_fsub_meta_refresher = None
+
+FSUB_FLOODWAIT_MAX = 10  # longest FloodWait a force-sub check will sit out before letting the user through
+FSUB_RETRY_COOLDOWN = 2  # seconds between "Try Again" checks per user
+_last_fsub_check = TTLDict(ttl=60)  # user_id -> monotonic time of the last check; idle users age out
+
+async def _member_status(client, channel_id, user_id):
+    """Cached get_chat_member(...).status; raises UserNotParticipant (and drops the entry) if not joined"""
+    key = (channel_id, user_id)
+    hit = _member_cache.get(key)
+    now = time.monotonic()
+    if hit is not None and now - hit[0] < FSUB_MEMBER_TTL:
+        return hit[1]
+    try:
+        user = await client.get_chat_member(channel_id, user_id)
+    except UserNotParticipant:
+        _member_cache.pop(key, None)
+        raise
+    _member_cache[key] = (now, user.status)
+    return user.status
+
+async def _channel_info(client, channel_id):
+    """(title, join url) for an FSUB channel, fetched once"""
+    info = _channel_info_cache.get(channel_id)
+    if info is None:
+        chat = await client.get_chat(channel_id)
+        url = chat.invite_link if chat.invite_link else f"https://t.me/{chat.username}"
+        info = _channel_info_cache[channel_id] = (chat.title, url)
+    return info
+
+async def _with_floodwait(coro_factory):
+    """Await coro_factory(), sitting out one short FloodWait; longer waits are re-raised"""
+    try:
+        return await coro_factory()
+    except FloodWait as e:
+        if e.value > FSUB_FLOODWAIT_MAX:
+            raise
+        await asyncio.sleep(e.value)
+        return await coro_factory()
+
+async def _refresh_fsub_meta(client):
+    """Fetch every FSUB channel's (title, url) now and again every FSUB_META_REFRESH seconds"""
+    while True:
+        for channel_id in FSUB_CHANNELS:
+            try:
+                chat = await client.get_chat(channel_id)
+            except FloodWait as e:
+                await asyncio.sleep(e.value)
+                continue
+            except RPCError as e:
+                logger.warning("Could not refresh FSub channel %s: %s", channel_id, e)
+                continue
+            url = chat.invite_link if chat.invite_link else f"https://t.me/{chat.username}"
+            _channel_info_cache[channel_id] = (chat.title, url)
+        await asyncio.sleep(FSUB_META_REFRESH)
+
+def _ensure_fsub_meta_refresher(client):
+    """Start the channel metadata refresher on first use (needs a running client)"""
+    global _fsub_meta_refresher
+    if _fsub_meta_refresher is None or _fsub_meta_refresher.done():
+        _fsub_meta_refresher = asyncio.get_running_loop().create_task(_refresh_fsub_meta(client))
+
+async def _check_channel(client, channel_id, user_id):
+    """("ok",), ("banned",) or ("unjoined", title, url) for one FSUB channel.
+
+    Telegram errors fail open ("ok") so a misconfigured channel can't lock everyone out.
+    """
+    try:
+        status = await _with_floodwait(lambda: _member_status(client, channel_id, user_id))
+        if status == ChatMemberStatus.BANNED:
+            return ("banned",)
+    except UserNotParticipant:
+        try:
+            title, url = await _with_floodwait(lambda: _channel_info(client, channel_id))
+            return ("unjoined", title, url)
+        except RPCError as e:
+            logger.warning("Error getting chat info for %s: %s", channel_id, e)
+    except RPCError as e:
+        logger.warning("FSub check failed for %s: %s", channel_id, e)
+    return ("ok",)
+
+async def check_fsub_channels(client, channels, user_id):
+    """Check every FSUB channel concurrently; returns (banned, [(title, url) of unjoined channels])
+
+    A ban in any channel settles the answer, so the remaining checks are cancelled.
+    """
+    _ensure_fsub_meta_refresher(client)
+    tasks = [asyncio.create_task(_check_channel(client, c, user_id)) for c in channels]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            if (await next_done)[0] == "banned":
+                return True, []
+    finally:
+        for task in tasks:
+            task.cancel()
+    unjoined = [r[1:] for r in (t.result() for t in tasks) if r[0] == "unjoined"]
+    return False, unjoined
+
 async def is_subscribed(client, message):
-    # Filter out zero/empty channel IDs
-    channels = []
-    if FSUB_CHANNEL and FSUB_CHANNEL != 0:
-        channels.append(FSUB_CHANNEL)
-    if FSUB_CHANNEL_2 and FSUB_CHANNEL_2 != 0:
-        channels.append(FSUB_CHANNEL_2)
-    if FSUB_CHANNEL_3 and FSUB_CHANNEL_3 != 0:
-        channels.append(FSUB_CHANNEL_3)
-    
     # If no channels are configured, allow access
-    if not channels:
+    if not FSUB_CHANNELS:
         return True
     
-    unjoined_channels = []
-    channel_info_list = []
+    # Channel posts and anonymous admins have no user to check; let them through as before
+    if message.from_user is None:
+        return True
     
-    # Check each channel
-    for channel_id in channels:
-        try:
-            user = await client.get_chat_member(channel_id, message.from_user.id)
-            if user.status == "kicked":
-                await message.reply_text("<blockquote><b>❌ You are banned from using this bot.</b></blockquote>")
-                return False
-        except UserNotParticipant:
-            # Get channel info
-            try:
-                chat = await client.get_chat(channel_id)
-                channel_url = chat.invite_link if chat.invite_link else f"https://t.me/{chat.username}"
-                unjoined_channels.append({
-                    "id": channel_id,
-                    "title": chat.title,
-                    "url": channel_url
-                })
-                channel_info_list.append(f"• {chat.title}")
-            except Exception as e:
-                print(f"Error getting chat info: {e}")
-                continue
-        except Exception as e:
-            print(f"FSub Error for {channel_id}: {e}")
-            continue
+    user_id = message.from_user.id
+    now = time.monotonic()
+    if _sub_cache.get(user_id, 0) > now:
+        return True
+    
+    # Check all channels at once
+    banned, unjoined_channels = await check_fsub_channels(client, FSUB_CHANNELS, user_id)
+    if banned:
+        await message.reply_text("<blockquote><b>❌ You are banned from using this bot.</b></blockquote>")
+        return False
     
     # If user hasn't joined all channels, show the requirement message
     if unjoined_channels:
         buttons = []
-        for idx, channel in enumerate(unjoined_channels, 1):
-            buttons.append([InlineKeyboardButton(f"Join Channel {idx} 📢", url=channel["url"])])
+        for idx, (title, url) in enumerate(unjoined_channels, 1):
+            buttons.append([InlineKeyboardButton(f"Join Channel {idx} 📢", url=url)])
         
         # Add Try Again button
         buttons.append([InlineKeyboardButton("Try Again 🔄", callback_data="check_fsub")])
         
-        channels_list = "\n".join(channel_info_list)
+        channels_list = "\n".join(f"• {title}" for title, _ in unjoined_channels)
         await message.reply_text(
             f"<blockquote><b>⚠️ Force Subscribe Required!</b></blockquote>\n\n"
             f"<blockquote>Please join all these channels to use the bot:\n\n"
@@ -79,9 +173,88 @@ async def is_subscribed(client, message):
             reply_markup=InlineKeyboardMarkup(buttons)
         )
         return False
-            
+    
+    _sub_cache[user_id] = now + SUB_CACHE_TTL
     return True
 
+BROADCAST_CONCURRENCY = 20  # copies in flight at once; broadcast_bucket caps the steady-state rate
+BROADCAST_PROGRESS_INTERVAL = 3  # seconds between progress edits
+# Recipients that can never be reached again; counted as blocked/deleted
+UNREACHABLE_ERRORS = (UserIsBlocked, UserDeactivated, InputUserDeactivated, PeerIdInvalid)
+
+async def broadcast_copy(source_msg, user_id_batches, on_progress=None):
+    """Copy source_msg to every user concurrently; returns {"success", "failed", "blocked"} counts.
+
+    user_id_batches is a blocking iterator of id lists (a Mongo cursor); it is advanced off the
+    event loop and feeds a bounded queue, so users are never all held in memory.
+    on_progress(done, counts) is awaited from a ticker task every BROADCAST_PROGRESS_INTERVAL
+    seconds, so progress edits never hold up a send worker.
+    """
+    queue = asyncio.Queue(maxsize=100)
+    stop = object()  # end-of-work marker; can't collide with any user id
+    counts = {"success": 0, "failed": 0, "blocked": 0}
+    done = 0
+    
+    async def produce():
+        while True:
+            batch = await asyncio.to_thread(next, user_id_batches, None)
+            if batch is None:
+                break
+            for user_id in batch:
+                await queue.put(user_id)
+        for _ in range(BROADCAST_CONCURRENCY):
+            await queue.put(stop)
+    
+    async def tick():
+        reported = 0
+        while True:
+            await asyncio.sleep(BROADCAST_PROGRESS_INTERVAL)
+            if done != reported:
+                reported = done
+                await on_progress(done, counts)
+    
+    async def worker():
+        while (user_id := await queue.get()) is not stop:
+            await send_one(user_id)
+    
+    async def send_one(user_id):
+        nonlocal done
+        await broadcast_bucket.acquire()
+        try:
+            await source_msg.copy(user_id)
+            counts["success"] += 1
+        except FloodWait as e:
+            # Hold every worker back, not just this one
+            broadcast_bucket.drain(e.value)
+            await broadcast_bucket.acquire()
+            try:
+                await source_msg.copy(user_id)
+                counts["success"] += 1
+            except UNREACHABLE_ERRORS:
+                counts["blocked"] += 1
+            except Exception:
+                counts["failed"] += 1
+        except UNREACHABLE_ERRORS:
+            counts["blocked"] += 1
+        except Exception:
+            counts["failed"] += 1
+        done += 1
+    
+    ticker = asyncio.create_task(tick()) if on_progress else None
+    tasks = [asyncio.create_task(produce())]
+    tasks += [asyncio.create_task(worker()) for _ in range(BROADCAST_CONCURRENCY)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # If the producer fails (e.g. the cursor errors) no stop markers are queued;
+        # don't leave the workers blocked on queue.get() or the ticker editing forever
+        if ticker:
+            tasks.append(ticker)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return counts
+
 async def safe_edit(message, text, reply_markup=None):
     """Safely edit a message, ignoring 'MESSAGE_NOT_MODIFIED' errors"""
     try:
@@ -90,6 +263,28 @@ async def safe_edit(message, text, reply_markup=None):
         if "MESSAGE_NOT_MODIFIED" not in str(e):
             raise e
 
+# COMMAND_TXT plus the /ls entry, built once
+UPDATED_COMMAND_TXT = COMMAND_TXT + "\n<blockquote>• /ls - Sequence files from channel links (range selection)</blockquote>"
+
+# Static keyboards, built once and reused for every user
+START_BUTTONS = InlineKeyboardMarkup([
+    [InlineKeyboardButton("ᴍʏ ᴀʟʟ ᴄᴏᴍᴍᴀɴᴅs", callback_data="all_cmds")],
+    [InlineKeyboardButton("ᴜᴘᴅᴀᴛᴇs", url="https://t.me/N4_Bots")],
+    [
+        InlineKeyboardButton("ᴄʟᴏsᴇ", callback_data="close"),
+        InlineKeyboardButton("ᴀʙᴏᴜᴛ", callback_data="help")
+    ]
+])
+ALL_CMDS_BUTTONS = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("ʙᴀᴄᴋ", callback_data="back_start"),
+        InlineKeyboardButton("ᴄʟᴏsᴇ", callback_data="close")
+    ]
+])
+HELP_BUTTONS = InlineKeyboardMarkup([
+    [InlineKeyboardButton("ʙᴀᴄᴋ", callback_data="back_start")]
+])
+
 def setup_start_handlers(app):
     """Register all start and related handlers"""
 
@@ -98,20 +293,11 @@ def setup_start_handlers(app):
         if not await is_subscribed(client, message):
             return
 
-        buttons = InlineKeyboardMarkup([
-            [InlineKeyboardButton("ᴍʏ ᴀʟʟ ᴄᴏᴍᴍᴀɴᴅs", callback_data="all_cmds")],
-            [InlineKeyboardButton("ᴜᴘᴅᴀᴛᴇs", url="https://t.me/N4_Bots")],
-            [
-                InlineKeyboardButton("ᴄʟᴏsᴇ", callback_data="close"),
-                InlineKeyboardButton("ᴀʙᴏᴜᴛ", callback_data="help")
-            ]
-        ])
-
         await client.send_photo(
             chat_id=message.chat.id,
             photo=START_PIC,
             caption=START_MSG,
-            reply_markup=buttons
+            reply_markup=START_BUTTONS
         )
 
     @app.on_callback_query()
@@ -129,43 +315,28 @@ def setup_start_handlers(app):
 
         # ---------------- FORCE SUBSCRIBE RECHECK ----------------
         if data == "check_fsub":
-            channels = []
-            if FSUB_CHANNEL and FSUB_CHANNEL != 0:
-                channels.append(FSUB_CHANNEL)
-            if FSUB_CHANNEL_2 and FSUB_CHANNEL_2 != 0:
-                channels.append(FSUB_CHANNEL_2)
-            if FSUB_CHANNEL_3 and FSUB_CHANNEL_3 != 0:
-                channels.append(FSUB_CHANNEL_3)
-
-            unjoined_channels = []
-            channel_info_list = []
-
-            for channel_id in channels:
-                try:
-                    user = await client.get_chat_member(channel_id, user_id)
-                    if user.status == "kicked":
-                        await query.answer("You are banned from using this bot!", show_alert=True)
-                        return
-                except UserNotParticipant:
-                    try:
-                        chat = await client.get_chat(channel_id)
-                        url = chat.invite_link if chat.invite_link else f"https://t.me/{chat.username}"
-                        unjoined_channels.append({"title": chat.title, "url": url})
-                        channel_info_list.append(f"• {chat.title}")
-                    except:
-                        continue
+            now = time.monotonic()
+            if now - _last_fsub_check.get(user_id, 0) < FSUB_RETRY_COOLDOWN:
+                await query.answer("Please wait…")
+                return
+            _last_fsub_check[user_id] = now
+            
+            banned, unjoined_channels = await check_fsub_channels(client, FSUB_CHANNELS, user_id)
+            if banned:
+                await query.answer("You are banned from using this bot!", show_alert=True)
+                return
 
             if unjoined_channels:
                 buttons = []
-                for i, ch in enumerate(unjoined_channels, 1):
+                for i, (title, url) in enumerate(unjoined_channels, 1):
                     buttons.append(
-                        [InlineKeyboardButton(f"Join Channel {i} 📢", url=ch["url"])]
+                        [InlineKeyboardButton(f"Join Channel {i} 📢", url=url)]
                     )
                 buttons.append(
                     [InlineKeyboardButton("Try Again 🔄", callback_data="check_fsub")]
                 )
                 
-                channels_list = "\n".join(channel_info_list)
+                channels_list = "\n".join(f"• {title}" for title, _ in unjoined_channels)
                 
                 await safe_edit(
                     query.message,
@@ -181,31 +352,16 @@ def setup_start_handlers(app):
                     user_id,
                     START_PIC,
                     START_MSG,
-                    reply_markup=InlineKeyboardMarkup([
-                        [InlineKeyboardButton("ᴍʏ ᴀʟʟ ᴄᴏᴍᴍᴀɴᴅs", callback_data="all_cmds")],
-                        [InlineKeyboardButton("ᴜᴘᴅᴀᴛᴇs", url="https://t.me/N4_Bots")],
-                        [
-                            InlineKeyboardButton("ᴄʟᴏsᴇ", callback_data="close"),
-                            InlineKeyboardButton("ᴀʙᴏᴜᴛ", callback_data="help")
-                        ]
-                    ])
+                    reply_markup=START_BUTTONS
                 )
             return
 
         # ---------------- MY ALL COMMANDS ----------------
         elif data == "all_cmds":
-            # Update COMMAND_TXT to include /ls and /sf
-            updated_command_txt = COMMAND_TXT + "\n<blockquote>• /ls - Sequence files from channel links (range selection)</blockquote>"
-            
             await safe_edit(
                 query.message,
-                updated_command_txt,
-                InlineKeyboardMarkup([
-                    [
-                        InlineKeyboardButton("ʙᴀᴄᴋ", callback_data="back_start"),
-                        InlineKeyboardButton("ᴄʟᴏsᴇ", callback_data="close")
-                    ]
-                ])
+                UPDATED_COMMAND_TXT,
+                ALL_CMDS_BUTTONS
             )
 
         # ---------------- BACK → START ----------------
@@ -213,14 +369,7 @@ def setup_start_handlers(app):
             await safe_edit(
                 query.message,
                 START_MSG,
-                InlineKeyboardMarkup([
-                    [InlineKeyboardButton("ᴍʏ ᴀʟʟ ᴄᴏᴍᴍᴀɴᴅs", callback_data="all_cmds")],
-                    [InlineKeyboardButton("ᴜᴘᴅᴀᴛᴇs", url="https://t.me/N4_Bots")],
-                    [
-                        InlineKeyboardButton("ᴄʟᴏsᴇ", callback_data="close"),
-                        InlineKeyboardButton("ᴀʙᴏᴜᴛ", callback_data="help")
-                    ]
-                ])
+                START_BUTTONS
             )
 
         # ---------------- ABOUT ----------------
@@ -228,9 +377,7 @@ def setup_start_handlers(app):
             await safe_edit(
                 query.message,
                 HELP_TXT,
-                InlineKeyboardMarkup([
-                    [InlineKeyboardButton("ʙᴀᴄᴋ", callback_data="back_start")]
-                ])
+                HELP_BUTTONS
             )
 
         # ---------------- CLOSE ----------------
@@ -243,10 +390,11 @@ def setup_start_handlers(app):
             return
             
         from database import get_top_users
-        top_users = get_top_users(5)
-        text = "<blockquote>🏆 ᴛᴏᴘ ᴜsᴇʀs</blockquote>\n\n"
-        for i, u in enumerate(top_users, 1):
-            text += f"<blockquote>**{i}. {u.get('username', 'User')}** - {u.get('files_sequenced', 0)} files\n</blockquote>"
+        top_users = await asyncio.to_thread(get_top_users, 5)
+        text = "<blockquote>🏆 ᴛᴏᴘ ᴜsᴇʀs</blockquote>\n\n" + "".join(
+            f"<blockquote>**{i}. {u.get('username', 'User')}** - {u.get('files_sequenced', 0)} files\n</blockquote>"
+            for i, u in enumerate(top_users, 1)
+        )
         await message.reply_text(text)
 
     @app.on_message(filters.command("status") & filters.user(OWNER_ID))
@@ -257,7 +405,7 @@ def setup_start_handlers(app):
         import time
         from database import get_total_users
         
-        total_users = get_total_users()
+        total_users = await asyncio.to_thread(get_total_users)
         
         # Uptime calculation
         if BOT_START_TIME:
@@ -306,35 +454,11 @@ def setup_start_handlers(app):
         # Direct broadcast without confirmation
         await message.reply_text("<blockquote>📤 Starting broadcast... Please wait.</blockquote>")
         
-        from database import get_all_users
-        all_users = get_all_users()
-        total_users = len(all_users)
+        from database import get_total_users, iter_user_id_batches
+        total_users = await asyncio.to_thread(get_total_users)
         
-        success = 0
-        failed = 0
-        blocked = 0
-        
-        for user in all_users:
-            user_id = user.get("user_id")
-            
-            try:
-                await message.reply_to_message.copy(user_id)
-                success += 1
-                await asyncio.sleep(0.1)
-                
-            except FloodWait as e:
-                await asyncio.sleep(e.value + 1)
-                try:
-                    await message.reply_to_message.copy(user_id)
-                    success += 1
-                except:
-                    failed += 1
-                    
-            except Exception as e:
-                if "USER_IS_BLOCKED" in str(e) or "user is deactivated" in str(e):
-                    blocked += 1
-                else:
-                    failed += 1
+        counts = await broadcast_copy(message.reply_to_message, iter_user_id_batches())
+        success, failed, blocked = counts["success"], counts["failed"], counts["blocked"]
         
         # Save broadcast stats
         save_broadcast_stats(total_users, success, failed, blocked)
@@ -363,13 +487,8 @@ def setup_start_handlers(app):
             await query.message.edit_text("<blockquote>📤 Starting broadcast... Please wait.</blockquote>")
             
             # Get all users
-            from database import get_all_users
-            all_users = get_all_users()
-            total_users = len(all_users)
-            
-            success = 0
-            failed = 0
-            blocked = 0
+            from database import get_total_users, iter_user_id_batches
+            total_users = await asyncio.to_thread(get_total_users)
             
             # Start broadcasting
             progress_msg = await query.message.edit_text(
@@ -378,38 +497,18 @@ def setup_start_handlers(app):
                 f"✅ Success: 0 | ❌ Failed: 0</blockquote>"
             )
             
-            for index, user in enumerate(all_users, 1):
-                user_id = user.get("user_id")
-                
+            async def show_progress(done, counts):
                 try:
-                    await query.message.reply_to_message.copy(user_id)
-                    success += 1
-                    
-                    if index % 20 == 0 or index == total_users:
-                        try:
-                            await progress_msg.edit_text(
-                                f"<blockquote>📤 Broadcasting...\n"
-                                f"Progress: {index}/{total_users}\n"
-                                f"✅ Success: {success} | ❌ Failed: {failed}</blockquote>"
-                            )
-                        except:
-                            pass
-                    
-                    await asyncio.sleep(0.1)
-                    
-                except FloodWait as e:
-                    await asyncio.sleep(e.value + 1)
-                    try:
-                        await query.message.reply_to_message.copy(user_id)
-                        success += 1
-                    except:
-                        failed += 1
-                        
-                except Exception as e:
-                    if "USER_IS_BLOCKED" in str(e) or "user is deactivated" in str(e):
-                        blocked += 1
-                    else:
-                        failed += 1
+                    await progress_msg.edit_text(
+                        f"<blockquote>📤 Broadcasting...\n"
+                        f"Progress: {done}/{total_users}\n"
+                        f"✅ Success: {counts['success']} | ❌ Failed: {counts['failed']}</blockquote>"
+                    )
+                except:
+                    pass
+            
+            counts = await broadcast_copy(query.message.reply_to_message, iter_user_id_batches(), show_progress)
+            success, failed, blocked = counts["success"], counts["failed"], counts["blocked"]
             
             # Save broadcast stats
             save_broadcast_stats(total_users, success, failed, blocked)
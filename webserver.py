@@ -1,33 +1,41 @@
+import asyncio
 import os
-import threading
-import subprocess
-import sys
-from flask import Flask
+from pyrogram import idle
+import bot
 
-app = Flask(__name__)
+RESPONSE = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/plain; charset=utf-8\r\n"
+    b"Content-Length: 36\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+    b"Bot is running with merging feature!"
+)
 
-@app.route("/")
-def index():
-    return "Bot is running with merging feature!"
-
-def run_bot():
-    """Run the bot as a separate process"""
+async def handle_probe(reader, writer):
+    """Answer any request with a canned 200; the host only checks that the port responds"""
     try:
-        print("Starting bot...")
-        subprocess.run([sys.executable, "bot.py"])
-    except Exception as e:
-        print(f"Bot error: {e}")
+        await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+        writer.write(RESPONSE)
+        await writer.drain()
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
 
-def run_server():
-    """Run Flask server"""
+async def main():
+    """Serve the keepalive endpoint and run the bot on the same event loop"""
     port = int(os.environ.get("PORT", 10000))
-    app.run(host="0.0.0.0", port=port, debug=False, use_reloader=False)
+    server = await asyncio.start_server(handle_probe, "0.0.0.0", port)
+    async with server:
+        print("Starting bot...")
+        await bot.app.start()
+        try:
+            await idle()
+        finally:
+            await bot.app.stop()
 
 if __name__ == "__main__":
-    # Start bot in separate thread
-    bot_thread = threading.Thread(target=run_bot)
-    bot_thread.daemon = True
-    bot_thread.start()
-    
-    # Start web server
-    run_server()
+    bot.setup_bot()
+    # The client is bound to the loop that existed when it was created, so run on that one
+    bot.app.run(main())